@@ -1,12 +1,38 @@
 
 
+from functools import lru_cache
+
 import numpy as np
 import cv2
 
+from Mosse_Tracker.TrackBuffer import TrackBuffer
+
+#number of patch sizes whose window and target are kept
+WINDOW_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def windowAndTarget(width, height):
+    #hanning window and dft of the gaussian target of a patch size
+    #shared by all the trackers of that size, so they are read only
+    win = cv2.createHanningWindow((width, height), cv2.CV_32F)
+    g = np.zeros((height, width), np.float32)
 
+    g[int(height/2), int(width/2)] = 1
+    g = cv2.GaussianBlur(g, (-1, -1), 3.0) #2.0
+    g = g / g.max()
+
+    G = cv2.dft(g, flags=cv2.DFT_COMPLEX_OUTPUT)
+    win.flags.writeable = False
+    G.flags.writeable = False
+    return win, G
 
 
 class MOSSE:
+    __slots__ = ("dx", "dy", "centers", "learning_rate", "num_of_traning_imgs", "psr_goodness",
+                 "updated_last_time", "width", "height", "area", "center", "size", "win", "G",
+                 "H1", "H2", "H", "filter_den", "last_img", "psr", "last_resp", "good")
+
     def __init__(self, frame, cut_size,num_of_traning_imgs = 10,learning_rate = 0.225,psrGoodness = 10):
         #get the xmin,ymin, xmax ,ymax for all the corners in the cut_Size
         xmin, ymin, xmax, ymax = cut_size
@@ -14,9 +40,9 @@ class MOSSE:
         ymin -= 0
         xmax += 0
         ymax += 0
-        self.dx =[]
-        self.dy = []
-        self.centers = []
+        self.dx = TrackBuffer(cumulative=True)
+        self.dy = TrackBuffer(cumulative=True)
+        self.centers = TrackBuffer(width=2)
         self.learning_rate = learning_rate
         self.num_of_traning_imgs = num_of_traning_imgs
         self.psr_goodness = psrGoodness
@@ -35,15 +61,8 @@ class MOSSE:
         #take a capture of the frame
         img = cv2.getRectSubPix(frame, (self.width, self.height), (x, y))
 
-        #creating window of the cut_size
-        self.win = cv2.createHanningWindow((self.width, self.height), cv2.CV_32F)
-        g = np.zeros((self.height, self.width), np.float32)
-
-        g[int(self.height/2), int(self.width/2)] = 1
-        g = cv2.GaussianBlur(g, (-1, -1), 3.0) #2.0
-        g = g / g.max()
-
-        self.G = cv2.dft(g, flags=cv2.DFT_COMPLEX_OUTPUT)
+        #creating window of the cut_size and the target
+        self.win, self.G = windowAndTarget(self.width, self.height)
 
         self.prepareInitialTracking(frame,img)
 
@@ -51,6 +70,9 @@ class MOSSE:
     def prepareInitialTracking(self, frame, cut_image):
         self.H1 = np.zeros_like(self.G)
         self.H2 = np.zeros_like(self.G)
+        #buffers the filter is computed into on every update
+        self.H = np.zeros_like(self.G)
+        self.filter_den = np.zeros_like(self.G)
         cut_image= cv2.GaussianBlur(cut_image,(3,3),3)
 
         for index in range(self.num_of_traning_imgs):
@@ -68,13 +90,7 @@ class MOSSE:
         (x, y), (w, h) = self.center, self.size
 
         if is_stopped and  self.updated_last_time:
-            dx = sum(self.dx[-3:]) / 3
-            dy = sum(self.dy[-3:]) / 3
-            self.center = x + dx, y + dy
-
-            self.dx.append(dx)
-            self.dy.append(dy)
-            self.updated_last_time = False
+            self.interpolateTracking()
         else:
 
             self.updated_last_time = True
@@ -85,33 +101,15 @@ class MOSSE:
             img = self.preprocess(img)
 
             self.psr, self.last_resp, (dx, dy) = self.correlateNewImg(img)
-            self.good = self.psr > self.psr_goodness
-            if not self.good:
-                if len(self.dx) == 0:
-                    self.dx.append(0)
-                    self.dy.append(0)
-                else:
-                    self.dx.append(self.dx[-1])
-                    self.dy.append(self.dy[-1])
-                #this is the new center
-                self.center = x + self.dx[-1], y + self.dy[-1]
-
-            else:
-                # self.learning_rate = max(min(abs(100-self.good)/100)  -0.8 , 0.125)
-
-                self.dx.append(dx)
-                self.dy.append(dy)
-
-                #this is the new center
-                self.center = x + dx, y + dy
-
+            self.applyMove(dx, dy)
+            if self.good:
                 #cut same width and height for the new img
                 self.last_img = img = cv2.getRectSubPix(frame, (w, h), self.center)
                 #calcultate num and denumentator for the new image
                 H1,H2 = self.computeNumAndDen(img)
                 #update the num and den with learning rate to decay old one
-                self.H1 = self.H1 * (1.0-self.learning_rate) + H1 * self.learning_rate
-                self.H2 = self.H2 * (1.0-self.learning_rate) + H2 * self.learning_rate
+                cv2.addWeighted(self.H1, 1.0-self.learning_rate, H1, self.learning_rate, 0, self.H1)
+                cv2.addWeighted(self.H2, 1.0-self.learning_rate, H2, self.learning_rate, 0, self.H2)
                 #update the kernal
                 self.updateFilter()
 
@@ -119,6 +117,40 @@ class MOSSE:
         self.centers.append((x_new, y_new))
 
 
+    def applyMove(self, dx, dy):
+        #follow the correlation peak if it is good enough, otherwise repeat the last move
+        x, y = self.center
+        self.good = self.psr > self.psr_goodness
+        if not self.good:
+            if len(self.dx) == 0:
+                self.dx.append(0)
+                self.dy.append(0)
+            else:
+                self.dx.append(self.dx[-1])
+                self.dy.append(self.dy[-1])
+            #this is the new center
+            self.center = x + self.dx[-1], y + self.dy[-1]
+
+        else:
+            # self.learning_rate = max(min(abs(100-self.good)/100)  -0.8 , 0.125)
+
+            self.dx.append(dx)
+            self.dy.append(dy)
+
+            #this is the new center
+            self.center = x + dx, y + dy
+
+    def interpolateTracking(self):
+        #move a stopped vehicle by its last moves instead of correlating the frame
+        x, y = self.center
+        dx = sum(self.dx[-3:].tolist()) / 3
+        dy = sum(self.dy[-3:].tolist()) / 3
+        self.center = x + dx, y + dy
+
+        self.dx.append(dx)
+        self.dy.append(dy)
+        self.updated_last_time = False
+
     def preprocess(self, img):
         #to get good results with low contrast imgs
         img = np.log(np.float32(img)+1.0)
@@ -153,8 +185,13 @@ class MOSSE:
         return psr,response, (dx,dy)
 
     def updateFilter(self):
-        self.H = self.HFilter(self.H1, self.H2)
-        self.H[...,1] *= -1
+        #the kernel is kept conjugated: conj(H1 / H2) = H2 * conj(H1) / |H2|^2
+        #computed in place in the preallocated buffers
+        cv2.mulSpectrums(self.H2, self.H1, 0, self.H, conjB=True)
+        cv2.mulSpectrums(self.H2, self.H2, 0, self.filter_den, conjB=True)
+        den = self.filter_den[..., 0]
+        np.divide(self.H[..., 0], den, out=self.H[..., 0])
+        np.divide(self.H[..., 1], den, out=self.H[..., 1])
 
     def computeNumAndDen(self,img):
         f = self.preprocess(img)
@@ -183,14 +220,6 @@ class MOSSE:
         transformed_img = cv2.warpAffine(cut_img, transformation, (width, height), borderMode=cv2.BORDER_REFLECT)
         return transformed_img
 
-    def HFilter(self,Num, Den):
-        # applying the eq in the paper to  get the hfilter
-        Num_real, Num_imaginary = Num[..., 0], Num[..., 1]
-        Den_real, Den_imaginary = Den[..., 0], Den[..., 1]
-
-        h_filter = (Num_real + 1j * Num_imaginary) / (Den_real + 1j * Den_imaginary)
-        h_filter = np.dstack([np.real(h_filter), np.imag(h_filter)]).copy()
-        return h_filter
     def getCutFramePosition(self,center = -1):
         if center == -1:
             center = self.center
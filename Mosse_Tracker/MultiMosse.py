@@ -0,0 +1,114 @@
+import numpy as np
+import cv2
+
+#opencv handles at most 128 channels in one array (512 before opencv 5)
+MAX_GROUP_SIZE = 128
+#smaller groups are faster to update one tracker at a time
+MIN_GROUP_SIZE = 4
+
+
+class MultiMOSSE:
+    '''
+    updates many MOSSE trackers on the same frame at once:
+    trackers with the same patch size are stacked into one array, so the
+    blur, preprocessing, DFTs, correlation, PSR and filter updates of a whole group are
+    a few array operations instead of a python loop over the trackers
+    '''
+
+    def updateTracking(self, trackers, frame, is_stopped):
+        #trackers: the MOSSE trackers to update
+        #is_stopped: for each tracker, whether its vehicle is considered stopped
+        groups = {}
+        for tracker, stopped in zip(trackers, is_stopped):
+            if stopped and tracker.updated_last_time:
+                tracker.interpolateTracking()
+                tracker.centers.append(tracker.center)
+            else:
+                groups.setdefault(tracker.size, []).append(tracker)
+
+        for (w, h), group in groups.items():
+            if len(group) < MIN_GROUP_SIZE:
+                for tracker in group:
+                    tracker.updateTracking(frame, False)
+                continue
+            for start in range(0, len(group), MAX_GROUP_SIZE):
+                self.correlateGroup(group[start:start + MAX_GROUP_SIZE], frame, w, h)
+
+    def correlateGroup(self, group, frame, w, h):
+        win = group[0].win
+        G = self.toComplex(group[0].G)
+
+        patches = self.cutPatches(frame, [tracker.center for tracker in group], w, h)
+        for index, tracker in enumerate(group):
+            tracker.updated_last_time = True
+            tracker.last_img = patches[index]
+
+        #correlate every patch with its tracker's filter
+        F = np.fft.fft2(self.preprocess(self.blur(patches), win))
+        H = self.toComplex(np.stack([tracker.H for tracker in group]), conj=True)
+        responses = np.real(np.fft.ifft2(F * H)).astype(np.float32)
+
+        #peak of every response (first maximum in row order like cv2.minMaxLoc)
+        flat_responses = responses.reshape(len(group), h * w)
+        peaks = np.argmax(flat_responses, axis=1)
+        max_peak_values = flat_responses[np.arange(len(group)), peaks]
+        my, mx = np.divmod(peaks, w)
+
+        #psr: the peak against the response with an 11x11 square around the peak set to 0
+        rows = np.arange(h)[None, :, None]
+        cols = np.arange(w)[None, None, :]
+        around_peak = (np.abs(rows - my[:, None, None]) <= 5) & (np.abs(cols - mx[:, None, None]) <= 5)
+        side_resp = np.where(around_peak, 0, responses)
+        psrs = (max_peak_values - side_resp.mean(axis=(1, 2))) / (side_resp.std(axis=(1, 2)) + 1e-5)
+
+        good = []
+        for index, tracker in enumerate(group):
+            tracker.psr = psrs[index]
+            tracker.last_resp = responses[index]
+            tracker.applyMove(int(mx[index]) - int(w / 2), int(my[index]) - int(h / 2))
+            tracker.centers.append(tracker.center)
+            if tracker.good:
+                good.append(tracker)
+
+        if len(good) == 0:
+            return
+
+        #train the filters of the trackers that found their vehicle on the patch at the new center
+        patches = self.cutPatches(frame, [tracker.center for tracker in good], w, h)
+        F = np.fft.fft2(self.preprocess(patches, win))
+        rates = np.array([tracker.learning_rate for tracker in good], np.float32)[:, None, None, None]
+        H1 = np.stack([tracker.H1 for tracker in good]) * (1.0 - rates) + self.toChannels(G * np.conj(F)) * rates
+        H2 = np.stack([tracker.H2 for tracker in good]) * (1.0 - rates) + self.toChannels(F * np.conj(F)) * rates
+        H = self.toChannels(self.toComplex(H1) / self.toComplex(H2), conj=True)
+        for index, tracker in enumerate(good):
+            tracker.last_img = patches[index]
+            tracker.H1[...] = H1[index]
+            tracker.H2[...] = H2[index]
+            tracker.H[...] = H[index]
+
+    def cutPatches(self, frame, centers, w, h):
+        return np.stack([cv2.getRectSubPix(frame, (w, h), center) for center in centers])
+
+    def blur(self, patches):
+        #opencv blurs every channel on its own, so the patches are blurred as the channels of one image
+        blurred = cv2.GaussianBlur(np.ascontiguousarray(patches.transpose(1, 2, 0)), (3, 3), 3)
+        return blurred.reshape(patches.shape[1:] + (-1,)).transpose(2, 0, 1)
+
+    def preprocess(self, imgs, win):
+        #same as MOSSE.preprocess for every patch
+        imgs = np.log(np.float32(imgs) + 1.0)
+        mean = imgs.mean(axis=(1, 2), keepdims=True)
+        std_deviation = imgs.std(axis=(1, 2), keepdims=True)
+        imgs = (imgs - mean) / (std_deviation + 1e-5)
+        return imgs * win
+
+    def toComplex(self, spectrum, conj=False):
+        #two channel cv2 spectrum to a complex array
+        if conj:
+            return spectrum[..., 0] - 1j * spectrum[..., 1]
+        return spectrum[..., 0] + 1j * spectrum[..., 1]
+
+    def toChannels(self, spectrum, conj=False):
+        #complex array to a two channel cv2 spectrum
+        imaginary = -spectrum.imag if conj else spectrum.imag
+        return np.stack([spectrum.real, imaginary], axis=-1).astype(np.float32)
@@ -0,0 +1,114 @@
+import numpy as np
+
+
+class TrackBuffer:
+    '''
+    per frame values of a track (moves, centers, boxes) in one preallocated numpy array
+    that grows by doubling, used like the python lists it replaces:
+    append, len, indexing, slicing and iteration.
+    with cumulative=True it keeps running sums, so the sum of any range is O(1)
+    (the running sums are a plain list, appending and reading python floats is cheaper)
+    '''
+    __slots__ = ("values", "length", "sums")
+
+    def __init__(self, width=0, dtype=np.float64, capacity=32, cumulative=False):
+        #width: number of values per frame, 0 for a single value
+        shape = (capacity,) if width == 0 else (capacity, width)
+        self.values = np.empty(shape, dtype)
+        self.length = 0
+        self.sums = [0.0] if cumulative else None
+
+    @classmethod
+    def filled(cls, length, width=0, fill=np.nan, dtype=np.float64):
+        #buffer starting with length entries set to fill
+        buffer = cls(width, dtype, max(length, 32))
+        buffer.values[:length] = fill
+        buffer.length = length
+        return buffer
+
+    def append(self, value):
+        if self.length == len(self.values):
+            self.grow(max(2 * len(self.values), 32))
+        self.values[self.length] = value
+        if self.sums is not None:
+            self.sums.append(self.sums[-1] + value)
+        self.length += 1
+
+    def grow(self, capacity):
+        values = np.empty((capacity,) + self.values.shape[1:], self.values.dtype)
+        values[:self.length] = self.values[:self.length]
+        self.values = values
+
+    def view(self):
+        #the used part of the buffer as an array
+        return self.values[:self.length]
+
+    def sum(self, start=None, stop=None):
+        #sum of the values in [start:stop], same bounds as slicing a list
+        if start is None or stop is None or not 0 <= start <= stop <= self.length:
+            start, stop, _ = slice(start, stop).indices(self.length)
+        if stop <= start:
+            return 0.0
+        if self.sums is None:
+            return float(self.values[start:stop].sum())
+        return self.sums[stop] - self.sums[start]
+
+    def count(self, start=None, stop=None):
+        #number of values in [start:stop]
+        if start is None or stop is None or not 0 <= start <= stop <= self.length:
+            start, stop, _ = slice(start, stop).indices(self.length)
+        return max(stop - start, 0)
+
+    def drop(self, no_of_values):
+        #remove the first values, as if the track started later
+        kept = self.values[no_of_values:self.length].copy()
+        self.length = len(kept)
+        self.values[:self.length] = kept
+        if self.sums is not None:
+            self.sums = self.runningSums(kept)
+
+    def copy(self):
+        buffer = TrackBuffer.__new__(TrackBuffer)
+        buffer.__setstate__(self.__getstate__())
+        return buffer
+
+    def max(self):
+        return self.view().max().item()
+
+    def tolist(self):
+        return self.view().tolist()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.view()[index]
+        value = self.view()[index]
+        if self.values.ndim == 1:
+            return value.item()
+        return tuple(value.tolist())
+
+    def __setitem__(self, index, value):
+        self.view()[index] = value
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def __getstate__(self):
+        #only the used part is pickled, as raw bytes, the sums are rebuilt on load
+        return self.view().tobytes(), self.values.dtype.str, self.values.shape[1:], self.sums is not None
+
+    def __setstate__(self, state):
+        data, dtype, row_shape, cumulative = state
+        self.values = np.frombuffer(data, dtype).reshape((-1,) + tuple(row_shape)).copy()
+        self.length = len(self.values)
+        self.sums = self.runningSums(self.values) if cumulative else None
+
+    @staticmethod
+    def runningSums(values):
+        sums = [0.0]
+        for value in values.tolist():
+            sums.append(sums[-1] + value)
+        return sums
@@ -5,9 +5,11 @@ from threading import Thread
 from time import time
 import math
 import cv2
+import numpy as np
 from copy import deepcopy
 
 from Mosse_Tracker.Mosse import MOSSE
+from Mosse_Tracker.TrackBuffer import TrackBuffer
 from Mosse_Tracker.utils import draw_str
 from Mosse_Tracker.utils import RectSelector
 
@@ -25,8 +27,12 @@ class TrackerType(enum.Enum):
    DLIB = 2
 
 class Tracker:
+    __slots__ = ("history", "tracker_type", "width", "height", "tracker", "dx", "dy", "vehicle_width",
+                 "vehicle_height", "frame_width", "frame_height", "tracker_id", "index",
+                 "estimationFutureCenter")
+
     def __init__(self, frame, cut_size, frame_width, frame_height, tracker_id=0, tracker_type=TrackerType.MOSSE):
-        self.history = []
+        self.history = TrackBuffer(width=4, dtype=np.int32)
         self.tracker_type = tracker_type
         xmin, ymin, xmax, ymax = cut_size
         self.width, self.height = map(cv2.getOptimalDFTSize, [xmax - xmin, ymax - ymin])
@@ -39,8 +45,8 @@ class Tracker:
             self.tracker = dlib.correlation_tracker()
             self.tracker.start_track(frame, dlib.rectangle(int(xmin), int(ymin), int(xmax), int(ymax)))
             self.addHistory([xmin, ymin, xmax, ymax])
-            self.dx = []
-            self.dy = []
+            self.dx = TrackBuffer(cumulative=True)
+            self.dy = TrackBuffer(cumulative=True)
 
         xmin, ymin, xmax, ymax = cut_size
         self.vehicle_width, self.vehicle_height = map(cv2.getOptimalDFTSize, [xmax - xmin, ymax - ymin])
@@ -48,26 +54,21 @@ class Tracker:
         self.frame_height = frame_height
         self.tracker_id = tracker_id
         self.index = 0
-        self.avg_speed = [None]*30
-        self.estimationFutureCenter = [-1]*30
+        # predicted centers, nan where nothing was predicted
+        self.estimationFutureCenter = TrackBuffer.filled(30, width=2)
 
     def addHistory(self, cut_size):
         """Add current cut frame in history for later use"""
         self.history.append(cut_size)
 
     def getHistory(self):
-        """Get history in [[xmin,ymin,xmax,ymax]] format"""
+        """Get history, indexed by frame, of (xmin,ymin,xmax,ymax) boxes"""
         return self.history
 
     def update(self, frame):
         """Update the tracker to current frame and add the updated position to history"""
         if self.tracker_type == TrackerType.MOSSE:
-            is_stopped = False
-            if len(self.tracker.dx) >= 3 and Work_Tracker_Interpolation:
-                if self.getAvgSpeed(len(self.tracker.dx)-3, len(self.tracker.dx)) < 20:
-                    is_stopped = True
-
-            self.tracker.updateTracking(frame, is_stopped)
+            self.tracker.updateTracking(frame, self.isStopped())
             self.addHistory(self.tracker.getCutFramePosition())
 
         else:
@@ -85,6 +86,13 @@ class Tracker:
 
         return self.history[-1]
 
+    def isStopped(self):
+        """Whether the vehicle barely moved lately, so its MOSSE position can be interpolated"""
+        if len(self.tracker.dx) >= 3 and Work_Tracker_Interpolation:
+            if self.getAvgSpeed(len(self.tracker.dx)-3, len(self.tracker.dx)) < 20:
+                return True
+        return False
+
     def getTrackerPosition(self):
         """Get last tracker position"""
         return self.history[-1]
@@ -165,7 +173,7 @@ class Tracker:
 
     def clearHistory(self):
         """Clear tracking history"""
-        self.history = []
+        self.history = TrackBuffer(width=4, dtype=np.int32)
 
     def saveTracking(self, frames):
         """Save tracking results to video file"""
@@ -185,12 +193,9 @@ class Tracker:
 
     def getMaxSpeed(self):
         """Get maximum speed of the tracked object"""
-        if self.tracker_type == TrackerType.MOSSE:
-            x = max(self.tracker.dx)
-            y = max(self.tracker.dy)
-        else:
-            x = max(self.dx)
-            y = max(self.dy)
+        dx_change, dy_change = self.getMoves()
+        x = dx_change.max()
+        y = dy_change.max()
             
         r = pow(pow(x, 2)+pow(y, 2), 0.5)
         r_coefficient = r * self.getCarSizeCoefficient()
@@ -198,37 +203,24 @@ class Tracker:
         
     def getAvgSpeed(self, from_frame_no=-1, to_frame_no=-1):
         """Get average speed of the tracked object"""
-        if self.tracker_type == TrackerType.MOSSE:
-            if from_frame_no == -1 or to_frame_no == -1:
-                dx_change = self.tracker.dx
-                dy_change = self.tracker.dy
-            else:
-                dx_change = self.tracker.dx[from_frame_no:to_frame_no]
-                dy_change = self.tracker.dy[from_frame_no:to_frame_no]
-        else:
-            if from_frame_no == -1 or to_frame_no == -1:
-                dx_change = self.dx
-                dy_change = self.dy
-            else:
-                dx_change = self.dx[from_frame_no:to_frame_no]
-                dy_change = self.dy[from_frame_no:to_frame_no]
-
-        x = sum(dx_change)/len(dx_change)
-        y = sum(dy_change)/len(dy_change)
+        if from_frame_no == -1 or to_frame_no == -1:
+            from_frame_no, to_frame_no = None, None
+        dx_change, dy_change = self.getMoves()
+
+        # the running sums of the moves make this O(1)
+        no_of_moves = dx_change.count(from_frame_no, to_frame_no)
+        x = dx_change.sum(from_frame_no, to_frame_no)/no_of_moves
+        y = dy_change.sum(from_frame_no, to_frame_no)/no_of_moves
         r = pow(pow(x, 2) + pow(y, 2), 0.5)
         r_coefficient = r * self.getCarSizeCoefficient()
         return r_coefficient
 
     def getCurrentSpeed(self):
         """Get current speed of the tracked object"""
-        if self.tracker_type == TrackerType.MOSSE:
-            no_of_last_frames = min(len(self.tracker.dx), 3)
-            x = sum(self.tracker.dx[-no_of_last_frames:]) / no_of_last_frames
-            y = sum(self.tracker.dy[-no_of_last_frames:]) / no_of_last_frames
-        else:
-            no_of_last_frames = min(len(self.dx), 3)
-            x = sum(self.dx[-no_of_last_frames:]) / no_of_last_frames
-            y = sum(self.dy[-no_of_last_frames:]) / no_of_last_frames
+        dx_change, dy_change = self.getMoves()
+        no_of_last_frames = min(len(dx_change), 3)
+        x = dx_change.sum(-no_of_last_frames) / no_of_last_frames
+        y = dy_change.sum(-no_of_last_frames) / no_of_last_frames
             
         r = pow(pow(x, 2) + pow(y, 2), 0.5)
         r_coefficient = r * self.getCarSizeCoefficient()
@@ -236,24 +228,34 @@ class Tracker:
 
     def getCarSizeCoefficient(self):
         """Calculate size coefficient for speed normalization"""
+        coefficient = 43200/self.getArea()
+        return coefficient
+
+    def getArea(self):
+        """Get the area of the tracked patch"""
         if self.tracker_type == TrackerType.MOSSE:
-            area = self.tracker.area
-        else:
-            area = self.width * self.height
+            return self.tracker.area
+        return self.width * self.height
 
-        coefficient = 43200/area
-        return coefficient
+    def getCenters(self):
+        """Get the tracked centers, indexed by frame"""
+        if self.tracker_type == TrackerType.MOSSE:
+            return self.tracker.centers
+        centers = TrackBuffer(width=2)
+        for position in self.history:
+            centers.append(self.get_position(position))
+        return centers
+
+    def summary(self):
+        """Get the compact summary of the track that crash detection needs"""
+        return TrackSummary(self)
 
     def getCarAngle(self):
         """Calculate angle of movement in degrees"""
-        if self.tracker_type == TrackerType.MOSSE:
-            max_index_to_measure = min(1000, len(self.tracker.dx))
-            dx = sum(self.tracker.dx[:max_index_to_measure])
-            dy = sum(self.tracker.dy[:max_index_to_measure])
-        else:
-            max_index_to_measure = min(1000, len(self.dx))
-            dx = sum(self.dx[:max_index_to_measure])
-            dy = sum(self.dy[:max_index_to_measure])
+        dx_change, dy_change = self.getMoves()
+        max_index_to_measure = min(1000, len(dx_change))
+        dx = dx_change.sum(0, max_index_to_measure)
+        dy = dy_change.sum(0, max_index_to_measure)
             
         # Handle special cases
         if dx == 0:
@@ -280,33 +282,75 @@ class Tracker:
     def futureFramePosition(self):
         """Predict future position based on recent movement"""
         if self.tracker_type == TrackerType.MOSSE:
-            if len(self.tracker.dx) < 5 or len(self.tracker.dx) > 20:
-                self.estimationFutureCenter.append(self.tracker.center)
+            center = self.estimateFutureCenter(len(self.tracker.dx), self.tracker.center)
+            if center is None:
                 return -1, -1, -1, -1
-                
-            measure = min(len(self.tracker.dx), 10)
-            expectedPositionNo = len(self.tracker.dx) + 10
-            x, y = self.tracker.center
-            dx = sum(self.tracker.dx[-measure:]) / len(self.tracker.dx[-measure:])
-            dy = sum(self.tracker.dy[-measure:]) / len(self.tracker.dy[-measure:])
-            x_new = x + dx * measure
-            y_new = y + dy * measure
-            self.estimationFutureCenter[expectedPositionNo] = (x_new, y_new)
-            return self.tracker.getCutFramePosition((x_new, y_new))
+            return self.tracker.getCutFramePosition(center)
         else:
-            if len(self.dx) < 5 or len(self.dx) > 20:
-                self.estimationFutureCenter.append(self.get_position(self.history[-1]))
+            center = self.estimateFutureCenter(len(self.dx), self.get_position(self.history[-1]))
+            if center is None:
                 return -1, -1, -1, -1
-                
-            measure = min(len(self.dx), 10)
-            expectedPositionNo = len(self.dx) + 10
-            x, y = self.get_position(self.history[-1])
-            dx = sum(self.dx[-measure:]) / len(self.dx[-measure:])
-            dy = sum(self.dy[-measure:]) / len(self.dy[-measure:])
-            x_new = x + dx * measure
-            y_new = y + dy * measure
-            self.estimationFutureCenter[expectedPositionNo] = (x_new, y_new)
-            return self.getCutFramePosition((x_new, y_new))
+            return self.getCutFramePosition(center)
+
+    def estimateFutureCenter(self, no_of_moves, center):
+        """
+        Record the center expected 10 frames after the first no_of_moves moves
+
+        Args:
+            no_of_moves: Number of moves tracked so far
+            center: Center of the vehicle after those moves
+
+        Returns:
+            The expected center, or None if there are too few or too many moves to predict
+        """
+        if no_of_moves < 5 or no_of_moves > 20:
+            self.estimationFutureCenter.append(center)
+            return None
+
+        dx_change, dy_change = self.getMoves()
+        measure = min(no_of_moves, 10)
+        expectedPositionNo = no_of_moves + 10
+        x, y = center
+        dx = dx_change.sum(no_of_moves - measure, no_of_moves) / measure
+        dy = dy_change.sum(no_of_moves - measure, no_of_moves) / measure
+        x_new = x + dx * measure
+        y_new = y + dy * measure
+        self.estimationFutureCenter[expectedPositionNo] = (x_new, y_new)
+        return x_new, y_new
+
+    def getMoves(self):
+        """Get the per frame moves (dx, dy) of the tracked object"""
+        if self.tracker_type == TrackerType.MOSSE:
+            return self.tracker.dx, self.tracker.dy
+        return self.dx, self.dy
+
+    def rebase(self, no_of_frames):
+        """
+        Drop the first frames of the tracking so the frame indexes start at a new batch
+
+        Everything indexed by frame (history, moves, centers and the estimated future
+        centers) is shifted as if tracking started no_of_frames frames later.
+
+        Args:
+            no_of_frames: Number of frames to drop from the start
+        """
+        self.history.drop(no_of_frames)
+        dx_change, dy_change = self.getMoves()
+        dx_change.drop(no_of_frames)
+        dy_change.drop(no_of_frames)
+        if self.tracker_type == TrackerType.MOSSE:
+            self.tracker.centers.drop(no_of_frames)
+
+        # Redo the estimations the way they would have been made while tracking the kept frames,
+        # a MOSSE tracker has a move for its first frame while a DLIB one gets its first move
+        # on its first update, so its history is one position ahead of its moves
+        self.estimationFutureCenter = TrackBuffer.filled(30, width=2)
+        if self.tracker_type == TrackerType.MOSSE:
+            for no_of_moves in range(2, len(dx_change) + 1):
+                self.estimateFutureCenter(no_of_moves, self.tracker.centers[no_of_moves - 1])
+        else:
+            for no_of_moves in range(1, len(dx_change) + 1):
+                self.estimateFutureCenter(no_of_moves, self.get_position(self.history[no_of_moves]))
 
     def getFramesOfTracking(self, frames, last_no_of_frames=30):
         """Extract frames for crash detection analysis"""
@@ -325,10 +369,49 @@ class Tracker:
 
     def isAboveSpeedLimit(self, from_frame_no=-1, to_frame_no=-1):
         """Check if vehicle exceeds speed threshold"""
-        if self.avg_speed[to_frame_no] is None:
-            self.avg_speed[to_frame_no] = self.getAvgSpeed(from_frame_no, to_frame_no)
-            
-        return self.avg_speed[to_frame_no] > 50
+        # the average speed comes from the running sums, so it isn't cached any more
+        return self.getAvgSpeed(from_frame_no, to_frame_no) > 50
+
+
+class TrackSummary(Tracker):
+    """
+    What crash detection reads from a tracker: boxes, centers, moves and predicted
+    centers per frame plus the vehicle size, without the correlation filters and
+    image patches of the tracker itself, so it is small to send to the crash node
+    """
+    __slots__ = ("centers", "area")
+
+    def __init__(self, tracker):
+        """
+        Args:
+            tracker: The tracker to summarize
+        """
+        dx_change, dy_change = tracker.getMoves()
+        self.tracker = None
+        self.tracker_type = tracker.tracker_type
+        self.tracker_id = tracker.tracker_id
+        self.index = tracker.index
+        self.width, self.height = tracker.width, tracker.height
+        self.vehicle_width, self.vehicle_height = tracker.vehicle_width, tracker.vehicle_height
+        self.frame_width, self.frame_height = tracker.frame_width, tracker.frame_height
+        self.area = tracker.getArea()
+        self.history = tracker.history.copy()
+        self.centers = tracker.getCenters().copy()
+        self.dx = dx_change.copy()
+        self.dy = dy_change.copy()
+        self.estimationFutureCenter = tracker.estimationFutureCenter.copy()
+
+    def getMoves(self):
+        """Get the per frame moves (dx, dy) of the tracked object"""
+        return self.dx, self.dy
+
+    def getArea(self):
+        """Get the area of the tracked patch"""
+        return self.area
+
+    def getCenters(self):
+        """Get the tracked centers, indexed by frame"""
+        return self.centers
 
 
 class TrackerManager:
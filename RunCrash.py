@@ -1,4 +1,6 @@
 from System.Data.CONSTANTS import CRASHPORT
 from System.Node import *
 
-Node(NodeType.Crashing ,CRASHPORT).run()
+# guarded so stage worker processes can import this module
+if __name__ == "__main__":
+    Node(NodeType.Crashing ,CRASHPORT).run()
@@ -1,4 +1,6 @@
 from System.Data.CONSTANTS import DETECTPORT
 from System.Node import *
 
-Node(NodeType.Detetion,DETECTPORT).run()
\ No newline at end of file
+# guarded so stage worker processes can import this module
+if __name__ == "__main__":
+    Node(NodeType.Detetion,DETECTPORT).run()
\ No newline at end of file
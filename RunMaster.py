@@ -1,4 +1,6 @@
 from System.Data.CONSTANTS import *
 from System.Node import *
 
-Node(NodeType.Master,MASTERPORT).run()
\ No newline at end of file
+# guarded so stage worker processes can import this module
+if __name__ == "__main__":
+    Node(NodeType.Master,MASTERPORT).run()
\ No newline at end of file
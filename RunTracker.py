@@ -4,4 +4,6 @@ from System.Data.CONSTANTS import *
 from System.Node import *
 
 
-Node(NodeType.Tracking, TRACKPORT).run()
+# guarded so stage worker processes can import this module
+if __name__ == "__main__":
+    Node(NodeType.Tracking, TRACKPORT).run()
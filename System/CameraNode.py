@@ -1,8 +1,9 @@
-import copy
 from time import time
 import cv2
 import threading
 from System.Controller.JsonEncoder import JsonEncoder
+from System.Data.CONSTANTS import *
+from System.Data.FrameStore import FrameStore
 from boxes.yoloFiles import loadFile
 
 
@@ -32,6 +33,10 @@ class CameraNode(threading.Thread):
         self.city = city
         self.district_no = district_no
         self.json_encoder = JsonEncoder()
+        self.frame_store = None
+        if Work_Shared_Memory_Frames:
+            self.frame_store = FrameStore(f"argus_camera_{camera_id}", FRAME_STORE_SEGMENTS, 30,
+                                          self.frame_width, self.frame_height, create=True)
 
     def run(self):
         """Main thread method that processes the video"""
@@ -62,8 +67,18 @@ class CameraNode(threading.Thread):
             
             # When we have 30 frames, process them as a batch
             if len(frames) == 30:
-                # Create a deep copy for processing
-                new_frames_list = copy.deepcopy(frames)
+                # The nodes keep the frames shared with the previous batch, only new ones are sent
+                overlap = 0
+                if Work_Sliding_Window_Frames and self.no_of_frames > BATCH_FRAMES_NO:
+                    overlap = BATCH_OVERLAP_NO
+
+                # Frames are serialized before feed returns, so the batch needs no copy
+                new_frames_list = frames
+                frames_handle = None
+                if self.frame_store is not None:
+                    # Write the batch once into shared memory, only its handle is sent
+                    frames_handle = self.frame_store.write(frames[overlap:], self.no_of_frames - 29 + overlap)
+                    new_frames_list = None
                 
                 # Keep last 15 frames for next batch
                 frames = frames[15:]
@@ -83,7 +98,9 @@ class CameraNode(threading.Thread):
                     self.read_file,
                     new_boxes,
                     self.city,
-                    self.district_no
+                    self.district_no,
+                    frames_handle,
+                    overlap
                 )
                 
             # Track frame rate
@@ -92,4 +109,10 @@ class CameraNode(threading.Thread):
                 t = time()
 
         # Release video resource
-        cap.release()
\ No newline at end of file
+        cap.release()
+
+        # The block goes once the nodes are done with the last batches
+        if self.frame_store is not None:
+            self.frame_store.waitReleased()
+            self.frame_store.close()
+            self.frame_store.unlink()
\ No newline at end of file
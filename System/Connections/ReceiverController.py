@@ -1,34 +1,47 @@
+import signal
+import sys
 import threading
 import zmq
 from System.Controller.JsonDecoder import JsonDecoder
+from System.NodeType import NodeType
 
 
 #responsible for receiving all the messages
 class ReceiverController(threading.Thread):
     '''
     port: the port number that the thread will open on it
+    worker_link: address of the stage dispatcher to pull from instead of answering on the port
     '''
-    def __init__(self,port,type=None,read_file = False,tf=False):
+    def __init__(self,port,type=None,read_file = False,tf=False,worker_link=None):
         threading.Thread.__init__(self)
         self.port = port
         self.type = type
         self.read_file = read_file
         self.tf = tf
+        self.worker_link = worker_link
 
 
     def run(self):
         context = zmq.Context()
-        socket = context.socket(zmq.REP)
-        socket.bind("tcp://*:%s" % self.port)
+        if self.worker_link is None:
+            socket = context.socket(zmq.REP)
+            socket.bind("tcp://*:%s" % self.port)
+        else:
+            socket = context.socket(zmq.PULL)
+            socket.connect(self.worker_link)
 
         jsonDecoder = JsonDecoder(type=self.type,read_file = self.read_file,tf=self.tf)  # start the processing decoding method
+        if self.type == NodeType.Master:
+            self.closeOnSignals(jsonDecoder.getMaster())
 
         while True:
             #  Wait for next request from client
             try:
-
-                message = socket.recv_pyobj() #receive a message json
-                socket.send_pyobj("")
+                if self.worker_link is None:
+                    message = socket.recv_multipart(copy=False) #receive a message json and its frames
+                    socket.send_pyobj("")
+                else:
+                    message = socket.recv_multipart(copy=False)[1:] #pushed messages start with the camera key
                 # print("see")
                 # jsons = json.loads(message)
                 jsonDecoder.run(message)
@@ -40,5 +53,13 @@ class ReceiverController(threading.Thread):
                 # sleep(2)
                 pass
 
+    def closeOnSignals(self, master):
+        #a node stopped with SIGTERM skips atexit, so the master writes its queued segments before exiting
+        def close(signum, frame):
+            master.close()
+            sys.exit(0)
 
-
+        #signal handlers can only be set from the main thread of the process
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, close)
+            signal.signal(signal.SIGINT, close)
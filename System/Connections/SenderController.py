@@ -1,32 +1,70 @@
+import queue
 import threading
-from time import time
 
 import zmq
 
+from System.Data.CONSTANTS import *
+
 
 #to send all the messages jsons using ip and port
 class SenderController(threading.Thread):
+    '''
+    one long-lived sender per receiver address, shared by the whole process;
+    it owns a single socket and sends the queued messages in order
+    '''
+    senders = {}
+    senders_lock = threading.Lock()
 
-    def __init__(self,ip,port,msg):
-        threading.Thread.__init__(self)
+    def __init__(self,ip,port,queue_size=SENDER_QUEUE_SIZE):
+        threading.Thread.__init__(self, daemon=True)
         self.ip =ip #ip of the receiver
         self.port = port #port of the receiver
-        self.msg = msg# the message itself
+        #pipeline stages pull their messages, only the gui still answers every request
+        self.push = Work_Pipeline_Push_Pull and str(port) != str(GUIPORT)
+        self.link = "tcp://"+self.ip+":"+str(self.port)
+        self.messages = queue.Queue(queue_size) #bounded so a slow receiver holds the callers back
+        self.socket = None
 
-    def run(self):
-        try:
-            context = zmq.Context()
-            socket = context.socket(zmq.REQ)
-            link = "tcp://"+self.ip+":"+str(self.port)
-            socket.connect(link)
-            socket.RCVTIMEO =200000 #so it suspends if the receiver didn't send a message in the past  20 sec
-            socket.send_pyobj(self.msg)
-            jsons = socket.recv_pyobj()
-            # from Controller.JsonDecoder import JsonDecoder
-            # thread = JsonDecoder(jsons)
-            # thread.start()
-        except Exception as e:
-            print(e)
-            pass
+    @classmethod
+    def getSender(cls,ip,port):
+        #return the sender of that address, starting it on first use
+        with cls.senders_lock:
+            sender = cls.senders.get((ip,str(port)))
+            if sender is None:
+                sender = cls(ip,port)
+                sender.start()
+                cls.senders[(ip,str(port))] = sender
+            return sender
 
+    def put(self,parts,key=b"",wait=False):
+        #parts: the already serialized message frames
+        #key: the camera id, lets the stage dispatcher keep every camera on the same worker
+        done = threading.Event() if wait else None
+        self.messages.put((key,parts,done))
+        if done is not None:
+            done.wait()
 
+    def connect(self):
+        self.socket = zmq.Context.instance().socket(zmq.PUSH if self.push else zmq.REQ)
+        self.socket.RCVTIMEO = SENDER_TIMEOUT #so it suspends if the receiver didn't send a message in the past  20 sec
+        self.socket.LINGER = 0
+        self.socket.connect(self.link)
+
+    def run(self):
+        self.connect()
+        while True:
+            key, parts, done = self.messages.get()
+            try:
+                if self.push:
+                    self.socket.send_multipart([key]+parts,copy=False)
+                else:
+                    self.socket.send_multipart(parts,copy=False)
+                    self.socket.recv()
+            except zmq.ZMQError as e:
+                print(e)
+                #a REQ socket that missed its reply can't send again, so start a fresh one
+                self.socket.close()
+                self.connect()
+            finally:
+                if done is not None:
+                    done.set()
@@ -0,0 +1,43 @@
+import threading
+import zlib
+
+import zmq
+
+
+#receives every message of a stage and hands it to one of the stage's worker processes
+class StageDispatcher(threading.Thread):
+    '''
+    port: the stage port that the senders push to
+    worker_links: the addresses of the stage's workers
+    '''
+    def __init__(self,port,worker_links):
+        threading.Thread.__init__(self)
+        self.port = port
+        self.worker_links = worker_links
+        self.next_worker = 0
+
+    def selectWorker(self,key):
+        #messages of the same camera always go to the same worker so it keeps the camera's order and state
+        if key:
+            return zlib.crc32(key) % len(self.worker_links)
+        self.next_worker = (self.next_worker + 1) % len(self.worker_links)
+        return self.next_worker
+
+    def run(self):
+        context = zmq.Context.instance()
+        frontend = context.socket(zmq.PULL)
+        frontend.bind("tcp://*:%s" % self.port)
+
+        workers = []
+        for link in self.worker_links:
+            worker = context.socket(zmq.PUSH)
+            worker.bind(link)
+            workers.append(worker)
+
+        while True:
+            try:
+                parts = frontend.recv_multipart(copy=False)
+                workers[self.selectWorker(parts[0].bytes)].send_multipart(parts,copy=False)
+            except Exception as e:
+                print(e.__class__)
+                print(e)
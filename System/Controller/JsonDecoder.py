@@ -1,12 +1,18 @@
+import pickle
 import threading
 from time import time
 
+import numpy as np
+
 from System.Controller.JsonEncoder import JsonEncoder
 from System.Data.CONSTANTS import *
+from System.Data.FrameContext import FrameContext
+from System.Data.FrameStore import FrameStore
+from System.Data.FrameWindow import FrameWindow
 from System.Functions.Crashing import Crashing
 from System.Functions.Detection import Detection
 from System.Functions.Master import Master
-from System.Functions.Tracking import Tracking
+from System.Functions.Tracking import Tracking, TrackingSession
 from System.NodeType import NodeType
 from VIF.vif import VIF
 
@@ -31,6 +37,9 @@ class JsonDecoder(threading.Thread):
         self.read_file = read_file
         self.tf = tf
         self.table = {}  # For performance tracking
+        self.frame_stores = {}  # Shared memory frame stores by name
+        self.frame_window = FrameWindow()  # Frames each camera's next batch shares with its last one
+        self.tracking_sessions = {}  # Trackers kept alive per camera
         
         # Initialize components based on node type
         if type == NodeType.Detetion and not read_file:
@@ -43,28 +52,107 @@ class JsonDecoder(threading.Thread):
         if NodeType.Crashing == type:
             self.vif = VIF()
 
+        # The master keeps its crash records and database in memory for the whole run
+        self.master = None
+        if NodeType.Master == type:
+            self.master = Master()
+
     def run(self, message):
         """
         Process incoming message
         
         Args:
-            message: Message to process
+            message: Frames of the message to process
         """
         self.decode(message)
 
-    def decode(self, msg):
+    def decode(self, parts):
         """
         Decode message and route to appropriate handler
         
         Args:
-            msg: Message to decode
+            parts: Frames of the received message, a pickled header then one buffer per video frame
         """
+        msg = pickle.loads(parts[0])
+
+        # Rebuild the video frames as zero-copy arrays over the received buffers
+        if FRAMES_LAYOUT in msg:
+            msg[FRAMES] = [np.frombuffer(buffer, dtype=dtype).reshape(shape)
+                           for buffer, (dtype, shape) in zip(parts[1:], msg.pop(FRAMES_LAYOUT))]
+
         func = msg[FUNCTION]
 
+        if func in (FEED, DETECT, TRACK, CRASH):
+            # The batch ends here when it is dropped, fails or is checked for crashes,
+            # its shared memory segment goes back to the camera then
+            frames_handle = msg.get(FRAMES_HANDLE)
+            forwarded = False
+            try:
+                forwarded = self.decodeBatch(func, msg, frames_handle)
+            finally:
+                if not forwarded:
+                    self.releaseFrames(frames_handle)
+
+        elif func == RESULT:  # 5th step: process results
+            camera_id = msg[CAMERA_ID]
+            starting_frame_id = msg[STARTING_FRAME_ID]
+            crash_dimentions = msg[CRASH_DIMENTIONS]
+            city = msg[CITY]
+            district_no = msg[DISTRICT]
+            crash_frame = msg.get("CRASH_FRAME", None)
+
+            self.result(camera_id, starting_frame_id, crash_dimentions, city, district_no, crash_frame)
+
+        elif func == SEARCH:  # Search for crash records
+            start_date = msg[START_DATE]
+            end_date = msg[END_DATE]
+            start_time = msg[START_TIME]
+            end_time = msg[END_TIME]
+            city = msg[CITY]
+            district = msg[DISTRICT]
+            self.query(start_date, end_date, start_time, end_time, city, district)
+            
+        elif func == REQ_VIDEO:  # Request crash video
+            camera_id = msg[CAMERA_ID]
+            starting_frame_id = msg[STARTING_FRAME_ID]
+            self.reqVideo(camera_id, starting_frame_id)
+
+        elif func == RECENT_CRASHES:  # Get recent crash records
+            self.sendRecentCrashes()
+
+    def decodeBatch(self, func, msg, frames_handle):
+        """
+        Rebuild the frames of a pipeline message and route it to its stage
+
+        Args:
+            func: Stage of the message (FEED, DETECT, TRACK or CRASH)
+            msg: Decoded message
+            frames_handle: Shared memory handle of the frames, None if they came with the message
+
+        Returns:
+            forwarded: Whether the batch went on to the next stage with its shared memory segment
+        """
+        overlap = msg.get(OVERLAP, 0)
+        frames = self.mapFrames(msg)
+        if frames is None:
+            print(f"Frames of camera {msg[CAMERA_ID]} from {msg[STARTING_FRAME_ID]} were overwritten, batch dropped")
+            return False
+
+        # Put back the frames that were only sent with the previous batch
+        frames, window_overlap = self.frame_window.extend(msg[CAMERA_ID], msg[STARTING_FRAME_ID], frames, overlap,
+                                                          copy=frames_handle is not None)
+        if frames is None:
+            print(f"Missing previous frames of camera {msg[CAMERA_ID]} before {msg[STARTING_FRAME_ID]}, batch dropped")
+            return False
+        if window_overlap != overlap:
+            # the next nodes missed the batch dropped here, so this one goes on whole, with its own frames
+            if frames_handle is not None:
+                frames = [np.array(frame) for frame in frames]
+            frames_handle, overlap = None, window_overlap
+
         if func == FEED:  # 1st step: receive feed from video file
             camera_id = msg[CAMERA_ID]
             starting_frame_id = msg[STARTING_FRAME_ID]
-            frames = msg[FRAMES]
             frame_width = msg[FRAME_WIDTH]
             frame_height = msg[FRAME_HEIGHT]
             read_file = msg[READ_FILE]
@@ -73,12 +161,11 @@ class JsonDecoder(threading.Thread):
             district_no = msg[DISTRICT]
 
             self.feed(camera_id, starting_frame_id, frames, frame_width, frame_height, 
-                     read_file, boxes_file, city, district_no)
+                     read_file, boxes_file, city, district_no, frames_handle, overlap)
 
         elif func == DETECT:  # 2nd step: detect cars in the first frame
             camera_id = msg[CAMERA_ID]
             starting_frame_id = msg[STARTING_FRAME_ID]
-            frames = msg[FRAMES]
             frame_width = msg[FRAME_WIDTH]
             frame_height = msg[FRAME_HEIGHT]
             read_file = msg[READ_FILE]
@@ -87,12 +174,11 @@ class JsonDecoder(threading.Thread):
             district_no = msg[DISTRICT]
 
             self.detect(camera_id, starting_frame_id, frames, frame_width, frame_height, 
-                        read_file, boxes_file, city, district_no)
+                        read_file, boxes_file, city, district_no, frames_handle, overlap)
 
         elif func == TRACK:  # 3rd step: track cars over frames
             camera_id = msg[CAMERA_ID]
             starting_frame_id = msg[STARTING_FRAME_ID]
-            frames = msg[FRAMES]
             frame_width = msg[FRAME_WIDTH]
             frame_height = msg[FRAME_HEIGHT]
             boxes = msg[BOXES]
@@ -102,12 +188,11 @@ class JsonDecoder(threading.Thread):
             end_detect_time = msg[END_DETECT_TIME]
 
             self.track(camera_id, starting_frame_id, frames, frame_width, frame_height, 
-                      boxes, start_detect_time, end_detect_time, city, district_no)
+                      boxes, start_detect_time, end_detect_time, city, district_no, frames_handle, overlap)
 
         elif func == CRASH:  # 4th step: check for crashes
             camera_id = msg[CAMERA_ID]
             starting_frame_id = msg[STARTING_FRAME_ID]
-            frames = msg[FRAMES]
             trackers = msg[TRACKERS]
             city = msg[CITY]
             district_no = msg[DISTRICT]
@@ -117,45 +202,52 @@ class JsonDecoder(threading.Thread):
             end_track_time = msg[END_TRACK_TIME]
 
             self.crash(camera_id, starting_frame_id, frames, trackers, start_detect_time, 
-                      end_detect_time, start_track_time, end_track_time, city, district_no)
+                      end_detect_time, start_track_time, end_track_time, city, district_no, frames_handle, overlap)
 
-        elif func == RESULT:  # 5th step: process results
-            camera_id = msg[CAMERA_ID]
-            starting_frame_id = msg[STARTING_FRAME_ID]
-            crash_dimentions = msg[CRASH_DIMENTIONS]
-            city = msg[CITY]
-            district_no = msg[DISTRICT]
-            crash_frame = msg.get("CRASH_FRAME", None)
+        return func != CRASH and frames_handle is not None
 
-            self.result(camera_id, starting_frame_id, crash_dimentions, city, district_no, crash_frame)
+    def mapFrames(self, msg):
+        """
+        Get the frames of a pipeline message
 
-        elif func == SEARCH:  # Search for crash records
-            start_date = msg[START_DATE]
-            end_date = msg[END_DATE]
-            start_time = msg[START_TIME]
-            end_time = msg[END_TIME]
-            city = msg[CITY]
-            district = msg[DISTRICT]
-            self.query(start_date, end_date, start_time, end_time, city, district)
-            
-        elif func == REQ_VIDEO:  # Request crash video
-            camera_id = msg[CAMERA_ID]
-            starting_frame_id = msg[STARTING_FRAME_ID]
-            self.reqVideo(camera_id, starting_frame_id)
+        Frames sent through shared memory are mapped as zero-copy NumPy views.
 
-        elif func == RECENT_CRASHES:  # Get recent crash records
-            self.sendRecentCrashes()
+        Args:
+            msg: Message carrying either the frames or their shared memory handle
+
+        Returns:
+            frames: The frames, or None if their segment was already overwritten
+        """
+        frames_handle = msg.get(FRAMES_HANDLE)
+        if frames_handle is None:
+            return msg[FRAMES]
+
+        name = frames_handle[STORE_NAME]
+        store = self.frame_stores.get(name)
+        if store is None or store.token != frames_handle[STORE_TOKEN]:
+            # first batch of the camera, or the camera was restarted and created its block again
+            if store is not None:
+                store.close()
+            store = self.frame_stores[name] = FrameStore.attach(frames_handle)
+        return store.read(frames_handle)
 
-    def feed(self, camera_id, starting_frame_id, frames, frame_width, frame_height, read_file, boxes_file, city, district_no):
+    def releaseFrames(self, frames_handle):
+        """Give the shared memory segment of a batch back to its camera"""
+        if frames_handle is None:
+            return
+        store = self.frame_stores.get(frames_handle[STORE_NAME])
+        if store is not None and store.token == frames_handle[STORE_TOKEN]:
+            store.release(frames_handle)
+
+    def feed(self, camera_id, starting_frame_id, frames, frame_width, frame_height, read_file, boxes_file, city, district_no, frames_handle=None, overlap=0):
         """
         Save frames and forward to detection step
         """
-        master = Master()
-        master.saveFrames(camera_id, starting_frame_id, frames, frame_width, frame_height)
+        self.getMaster().saveFrames(camera_id, starting_frame_id, frames, frame_width, frame_height, overlap)
         self.sender_encode.detect(camera_id, starting_frame_id, frames, frame_width, frame_height, 
-                                  read_file, boxes_file, city, district_no)
+                                  read_file, boxes_file, city, district_no, frames_handle, overlap)
 
-    def detect(self, camera_id, starting_frame_id, frames, frame_width, frame_height, read_file, boxes_file, city, district_no):
+    def detect(self, camera_id, starting_frame_id, frames, frame_width, frame_height, read_file, boxes_file, city, district_no, frames_handle=None, overlap=0):
         """
         Detect vehicles in frames and forward to tracking step
         """
@@ -174,22 +266,30 @@ class JsonDecoder(threading.Thread):
         # Log performance and forward to tracking
         self.printLog("Detect", camera_id, start_detect_time, starting_frame_id+len(frames))
         self.sender_encode.track(camera_id, starting_frame_id, frames, boxes, 
-                                frame_width, frame_height, start_detect_time, city, district_no)
+                                frame_width, frame_height, start_detect_time, city, district_no, frames_handle, overlap)
 
-    def track(self, camera_id, starting_frame_id, frames, frame_width, frame_height, boxes, start_detect_time, end_detect_time, city, district_no):
+    def track(self, camera_id, starting_frame_id, frames, frame_width, frame_height, boxes, start_detect_time, end_detect_time, city, district_no, frames_handle=None, overlap=0):
         """
         Track vehicles across frames and forward to crash detection
         """
         start_track_time = time()
+        context = FrameContext(frames)
         
-        track = Tracking()
-        trackers = track.track(frames, boxes, frame_width, frame_height)
+        if Work_Tracker_Sessions:
+            if camera_id not in self.tracking_sessions:
+                self.tracking_sessions[camera_id] = TrackingSession()
+            track = self.tracking_sessions[camera_id]
+            trackers = track.track(frames, boxes, frame_width, frame_height, starting_frame_id, context)
+        else:
+            track = Tracking()
+            trackers = track.track(frames, boxes, frame_width, frame_height, context)
         
         self.printLog("Track", camera_id, start_track_time, starting_frame_id+len(frames))
-        self.sender_encode.crash(camera_id, starting_frame_id, frames, trackers, 
-                                start_detect_time, end_detect_time, start_track_time, city, district_no)
+        # the crash node only gets the tracks, not the trackers' filters and patches
+        self.sender_encode.crash(camera_id, starting_frame_id, frames, track.summaries(trackers), 
+                                start_detect_time, end_detect_time, start_track_time, city, district_no, frames_handle, overlap)
 
-    def crash(self, camera_id, starting_frame_id, frames, trackers, start_detect_time, end_detect_time, start_track_time, end_track_time, city, district_no):
+    def crash(self, camera_id, starting_frame_id, frames, trackers, start_detect_time, end_detect_time, start_track_time, end_track_time, city, district_no, frames_handle=None, overlap=0):
         """
         Check for crashes among tracked vehicles
         """
@@ -198,7 +298,7 @@ class JsonDecoder(threading.Thread):
 
         start_crash_time = time()
         crashing = Crashing(self.vif)
-        crash_dimentions, crash_frame, crash_frame_index = crashing.crash(frames, trackers)
+        crash_dimentions, crash_frame, crash_frame_index = crashing.crash(frames, trackers, FrameContext(frames))
         
         self.printLog("Crash", camera_id, start_crash_time, starting_frame_id+len(frames))
         self.sender_encode.result(camera_id, starting_frame_id, crash_dimentions, 
@@ -209,23 +309,25 @@ class JsonDecoder(threading.Thread):
         """
         Process crash detection results
         """
-        master = Master()
-        master.checkResult(camera_id, starting_frame_id, crash_dimentions, city, district_no, crash_frame)
+        self.getMaster().checkResult(camera_id, starting_frame_id, crash_dimentions, city, district_no, crash_frame)
 
     def query(self, start_date, end_date, start_time, end_time, city, district):
         """Execute search query for crash records"""
-        master = Master()
-        master.executeQuery(start_date, end_date, start_time, end_time, city, district)
+        self.getMaster().executeQuery(start_date, end_date, start_time, end_time, city, district)
 
     def reqVideo(self, camera_id, starting_frame_id):
         """Request video for a specific crash"""
-        master = Master()
-        master.sendVideoToGUI(camera_id, starting_frame_id)
+        self.getMaster().sendVideoToGUI(camera_id, starting_frame_id)
 
     def sendRecentCrashes(self):
         """Retrieve and send recent crash records"""
-        master = Master()
-        master.sendRecentCrashesToGUI()
+        self.getMaster().sendRecentCrashesToGUI()
+
+    def getMaster(self):
+        """Get the master state of the node, loaded on first use"""
+        if self.master is None:
+            self.master = Master()
+        return self.master
 
     def printLog(self, Module, camera_id, starting_time, number_of_frames):
         """Log performance metrics for system modules"""
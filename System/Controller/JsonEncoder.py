@@ -2,6 +2,8 @@ import json
 import pickle as pickle
 from time import time
 
+import numpy as np
+
 from System.Connections.SenderController import SenderController
 from System.Data.CONSTANTS import *
 
@@ -13,48 +15,73 @@ class JsonEncoder:
 
 
     def send(self,ip,port,json,use_treading = True):
-        thread = SenderController(ip,port,json)
-        if use_treading:
-            thread.start()
+        #the message is serialized on the caller's thread so it can't change while queued
+        if str(port) == str(GUIPORT):
+            parts = [pickle.dumps(json,pickle.HIGHEST_PROTOCOL)] #the gui reads plain pickled messages
+        else:
+            parts = self.encode(json)
+        key = str(json.get(CAMERA_ID,"")).encode()
+        #reuse the process-wide sender of that address, wait for the reply only when not threaded
+        SenderController.getSender(ip,port).put(parts,key,wait=not use_treading)
+
+    def encode(self,json):
+        #wire format: a small pickled header followed by one raw buffer per frame,
+        #the frames are sent without copying and never go through pickle
+        frames = json.get(FRAMES)
+        if frames is None:
+            return [pickle.dumps(json,pickle.HIGHEST_PROTOCOL)]
+
+        header = dict(json)
+        del header[FRAMES]
+        buffers = [np.ascontiguousarray(frame) for frame in frames]
+        header[FRAMES_LAYOUT] = [(frame.dtype.str,frame.shape) for frame in buffers]
+        return [pickle.dumps(header,pickle.HIGHEST_PROTOCOL)] + buffers
+
+    def addFrames(self,sendingMsg,frames,frames_handle,overlap=0):
+        #the first overlap frames were sent with the previous batch and are kept by the receiver
+        sendingMsg[OVERLAP] = overlap
+        #frames held in shared memory travel as their handle only
+        if frames_handle is not None:
+            sendingMsg[FRAMES_HANDLE] = frames_handle
         else:
-            thread.run()
+            sendingMsg[FRAMES] = frames[overlap:]
+        return sendingMsg
 
-    def feed(self,camera_id,starting_frame_id,frames,frame_width,frame_height,read_file,boxes,city,district_no):
+    def feed(self,camera_id,starting_frame_id,frames,frame_width,frame_height,read_file,boxes,city,district_no,frames_handle=None,overlap=0):
         func = FEED
         sendingMsg = {FUNCTION:func,
                       CAMERA_ID:camera_id,
                       STARTING_FRAME_ID:starting_frame_id,
-                      FRAMES:frames,
                       FRAME_WIDTH:frame_width,
                       FRAME_HEIGHT:frame_height,
                       READ_FILE:read_file,
                       BOXES:boxes,
                       CITY:city,
                       DISTRICT:district_no}
+        self.addFrames(sendingMsg,frames,frames_handle,overlap)
 
         self.send(MASTERIP,MASTERPORT,sendingMsg,False)
 
-    def detect(self,camera_id,starting_frame_id,frames,frame_width,frame_height,read_file,boxes_file,city,district_no):
+    def detect(self,camera_id,starting_frame_id,frames,frame_width,frame_height,read_file,boxes_file,city,district_no,frames_handle=None,overlap=0):
         func = DETECT
         sendingMsg = {FUNCTION:func,
                       CAMERA_ID:camera_id,
                       STARTING_FRAME_ID:starting_frame_id,
-                      FRAMES:frames,
                       FRAME_WIDTH:frame_width,
                       FRAME_HEIGHT:frame_height,
                       READ_FILE:read_file,
                       BOXES:boxes_file,
                       CITY:city,
                       DISTRICT: district_no}
+        self.addFrames(sendingMsg,frames,frames_handle,overlap)
 
         self.send(DETECTIP, DETECTPORT, sendingMsg)
 
-    def track(self,camera_id, starting_frame_id, frames, boxes,frame_width,frame_height,start_detect_time,city,district_no):
+    def track(self,camera_id, starting_frame_id, frames, boxes,frame_width,frame_height,start_detect_time,city,district_no,frames_handle=None,overlap=0):
         func = TRACK
         sendingMsg = {FUNCTION: func,
                       CAMERA_ID: camera_id,
                       STARTING_FRAME_ID: starting_frame_id,
-                      FRAMES: frames,
                       BOXES: boxes,
                       CITY: city,
                       DISTRICT: district_no,
@@ -62,15 +89,15 @@ class JsonEncoder:
                       FRAME_HEIGHT:frame_height,
                       START_DETECT_TIME:start_detect_time,
                       END_DETECT_TIME:time()}
+        self.addFrames(sendingMsg,frames,frames_handle,overlap)
 
         self.send(TRACKIP, TRACKPORT, sendingMsg)
 
-    def crash(self,camera_id, starting_frame_id, frames, trackers,start_detect_time,end_detect_time,start_track_time,city,district_no):
+    def crash(self,camera_id, starting_frame_id, frames, trackers,start_detect_time,end_detect_time,start_track_time,city,district_no,frames_handle=None,overlap=0):
         func = CRASH
         sendingMsg = {FUNCTION: func,
                       CAMERA_ID: camera_id,
                       STARTING_FRAME_ID: starting_frame_id,
-                      FRAMES: frames,
                       TRACKERS: trackers,
                       CITY: city,
                       DISTRICT: district_no,
@@ -78,6 +105,7 @@ class JsonEncoder:
                       END_DETECT_TIME: end_detect_time,
                       START_TRACK_TIME: start_track_time,
                       END_TRACK_TIME: time()}
+        self.addFrames(sendingMsg,frames,frames_handle,overlap)
 
         # jsons = json.dumps(sendingMsg)
         self.send(CRASHIP, CRASHPORT, sendingMsg)
@@ -133,10 +161,11 @@ class JsonEncoder:
 
         self.send(MASTERIP, MASTERPORT, sendingMsg)
 
-    def replyQuery(self,list_of_crashes):
+    def replyQuery(self,list_of_crashes,disk_usage=None):
         func = REP_QUERY
         sendingMsg = {FUNCTION: func,
-                      LIST_OF_CRASHES: list_of_crashes}
+                      LIST_OF_CRASHES: list_of_crashes,
+                      DISK_USAGE: disk_usage}
 
         self.send(GUIIP, GUIPORT, sendingMsg) #change the address later
     def requestVideo(self, camera_id, starting_frame_id):
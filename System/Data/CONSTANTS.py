@@ -11,6 +11,7 @@ REP_QUERY = "REP_QUERY"
 REP_VIDEO = "REP_VIDEO"
 
 LIST_OF_CRASHES = "LIST_OF_CRASHES"
+DISK_USAGE = "DISK_USAGE"
 NOTIFICATION = "NOTIFICATION"
 VIDEO = "VIDEO"
 FRAME = "FRAME"
@@ -56,10 +57,44 @@ END_DETECT_TIME = "END_DETECT_TIME"
 END_TRACK_TIME = "END_TRACK_TIME"
 END_CRASH_TIME = "END_CRASH_TIME"
 
+FRAMES_HANDLE = "FRAMES_HANDLE"
+FRAMES_LAYOUT = "FRAMES_LAYOUT"
+OVERLAP = "OVERLAP"
+STORE_NAME = "STORE_NAME"
+STORE_SEGMENTS = "STORE_SEGMENTS"
+STORE_FRAMES_PER_SEGMENT = "STORE_FRAMES_PER_SEGMENT"
+STORE_SLOT = "STORE_SLOT"
+STORE_COUNT = "STORE_COUNT"
+STORE_TOKEN = "STORE_TOKEN"
+
+SENDER_QUEUE_SIZE = 64 # messages waiting per receiver before senders block
+SENDER_TIMEOUT = 200000 # milliseconds to wait for a receiver's reply
+
+WORKER_PORT_STRIDE = 100 # worker k of a stage listens on stage port + stride * (k + 1)
+DETECT_WORKERS = 1 # worker processes per stage when running the push/pull pipeline
+TRACK_WORKERS = 2
+CRASH_WORKERS = 2
+
+FRAME_STORE_SEGMENTS = 8 # number of batches a camera can have in flight in the shared memory ring
+FRAME_STORE_TIMEOUT = 10 # seconds a camera waits for a busy segment before overwriting it
+
+BATCH_FRAMES_NO = 30 # frames in every batch a camera sends
+BATCH_OVERLAP_NO = 15 # frames a batch shares with the previous one
+SEGMENT_FRAMES_NO = BATCH_FRAMES_NO - BATCH_OVERLAP_NO # frames per saved segment in sliding window mode
+
+TRACK_MATCH_IOU = 0.3 # overlap a detection needs with a tracker to keep tracking it in the next batch
+
 PRE_FRAMES_NO = 2
 NEXT_FRAMES_NO = 2
 TOTAL_FRAMES_NO = PRE_FRAMES_NO + NEXT_FRAMES_NO + 1
 
+SEGMENT_RING_FRAMES_NO = (PRE_FRAMES_NO + 1 + 4) * 30 # frames per camera the master keeps in memory for crash clips, 4 batches for results that come late
+SEGMENT_RING_BYTES = 512 * 1024 * 1024 # memory the kept frames of all the cameras may take
+SEGMENT_WRITER_THREADS = 2 # threads encoding the saved segments of the master in async writer mode
+SEGMENT_WRITER_QUEUE_SIZE = 16 # segments waiting per writer thread before saving blocks
+RAW_STORE_FRAMES_NO = 30 * 60 # frames of every camera kept in raw store mode (one minute), older ones are overwritten
+SEGMENT_RETENTION_GRACE_FRAMES = 30 * 60 # frames of saved segments kept beyond the crash pre-roll (one minute), older segments are deleted
+
 
 REQ_VIDEO = "REQ_VIDEO"
 RECENT_CRASHES = "RECENT_CRASHES"
@@ -67,4 +102,13 @@ RECENT_CRASHES = "RECENT_CRASHES"
 Work_Detect_Files = True # use files instead of yolo
 Work_Tracker_Type_Mosse = True # use Mosse tracker instead of Dlib taracker
 Work_Tracker_Interpolation = True #optimize performance by stop tracking stopped vehicles
+Work_Tracker_Batched_Mosse = True # update all MOSSE trackers of a frame together as stacked array operations
+Work_Tracker_Sessions = True # keep each camera's trackers alive between batches instead of creating them again
 Work_Crash_Estimation_Only = False #without using crash detection module (ViF descriptor)
+Work_VIF_OpenCV_Flow = True # compute the ViF optical flow in float32 with opencv instead of scipy
+Work_Pipeline_Push_Pull = False # stages pull from a dispatcher that spreads cameras over worker processes instead of one REP socket
+Work_Sliding_Window_Frames = True # send only the new frames of every batch, nodes keep the overlap themselves
+Work_Shared_Memory_Frames = True # pass frames through shared memory instead of the sockets (all nodes on one machine)
+Work_Async_Segment_Writer = True # encode the saved segments on background threads instead of in the FEED handler
+Work_Raw_Segment_Store = False # save frames as raw records in one memory mapped file per camera instead of MJPG videos
+Work_Segment_Retention = True # delete the saved segments a crash clip can't need anymore instead of keeping them forever
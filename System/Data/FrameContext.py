@@ -0,0 +1,74 @@
+import cv2
+
+
+class FrameContext:
+    """
+    Views of the frames of one batch that several steps of a node need.
+
+    Gray frames, crops and resized crops are computed the first time they are asked
+    for and then shared, so tracking every vehicle and checking every pair of
+    vehicles doesn't convert the same frames again.
+    """
+
+    def __init__(self, frames):
+        """
+        Args:
+            frames: BGR frames of the batch
+        """
+        self.frames = frames
+        self.gray_frames = [None] * len(frames)
+        self.resized_crops = {}  # (frame index, box, shape) -> resized gray crop
+        self.flow_caches = {}  # (box, shape, first frame) -> optical flow of frame pairs of the crops
+
+    def __len__(self):
+        return len(self.frames)
+
+    def gray(self, index):
+        """Gray version of a frame of the batch"""
+        if self.gray_frames[index] is None:
+            self.gray_frames[index] = cv2.cvtColor(self.frames[index], cv2.COLOR_BGR2GRAY)
+        return self.gray_frames[index]
+
+    def grayFrames(self):
+        """Gray versions of all the frames of the batch"""
+        return [self.gray(index) for index in range(len(self.frames))]
+
+    def cropped(self, index, box):
+        """View of a (xmin, ymin, xmax, ymax) box of a gray frame"""
+        xmin, ymin, xmax, ymax = box
+        return self.gray(index)[ymin:ymax, xmin:xmax]
+
+    def resized(self, index, box, shape):
+        """Gray crop of a frame resized to a (width, height) shape"""
+        key = (index, tuple(box), tuple(shape))
+        if key not in self.resized_crops:
+            self.resized_crops[key] = cv2.resize(self.cropped(index, box), shape)
+        return self.resized_crops[key]
+
+    def resizedFrames(self, box, shape, first=0):
+        """The resized crops of a box from a frame on, computed only for the frames that are read"""
+        return ResizedCrops(self, box, shape, first)
+
+    def flowCache(self, box, shape, first=0):
+        """Cache of the optical flow computed on the resized crops of a box, shared by every pair of its tracker"""
+        return self.flow_caches.setdefault((tuple(box), tuple(shape), first), {})
+
+
+class ResizedCrops:
+    """Sequence of the resized crops of a box, backed by the frame context"""
+
+    def __init__(self, context, box, shape, first):
+        self.context = context
+        self.box = tuple(box)
+        self.shape = tuple(shape)
+        self.first = first
+
+    def __len__(self):
+        return len(self.context) - self.first
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return self.context.resized(self.first + index, self.box, self.shape)
@@ -0,0 +1,151 @@
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+from time import sleep, time
+
+import numpy as np
+
+from System.Data.CONSTANTS import *
+
+
+class FrameStore:
+    """
+    Ring of preallocated shared memory segments holding frame batches.
+
+    The camera writes every batch once into the next free segment and only a small
+    handle travels through the pipeline; every node on the same machine maps the
+    frames of that handle as NumPy views without copying or unpickling them.
+    """
+
+    def __init__(self, name, segments, frames_per_segment, frame_width, frame_height, create=False, token=None):
+        """
+        Create or attach to a frame store
+
+        Args:
+            name: Name of the shared memory block
+            segments: Number of segments in the ring
+            frames_per_segment: Maximum number of frames held by a segment
+            frame_width: Width of every frame
+            frame_height: Height of every frame
+            create: Whether to create the block (camera side) or attach to it (node side)
+            token: Token of the block to attach to, a new one is made when the block is created
+        """
+        self.name = name
+        self.segments = segments
+        self.frames_per_segment = frames_per_segment
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.next_slot = 0
+        # a restarted camera creates its block again under the same name, nodes tell them apart by the token
+        self.token = uuid.uuid4().hex if create else token
+
+        # header holds, per slot, the starting frame id written last and the one released last
+        header_size = 2 * segments * np.dtype(np.int64).itemsize
+        data_size = segments * frames_per_segment * frame_height * frame_width * 3
+
+        if create:
+            self.removeStale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=header_size + data_size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # only the creator may unlink the block, readers must not remove it when they exit
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        self.generations = np.ndarray((segments,), np.int64, buffer=self.shm.buf)
+        self.released = np.ndarray((segments,), np.int64, buffer=self.shm.buf, offset=header_size // 2)
+        self.frames = np.ndarray((segments, frames_per_segment, frame_height, frame_width, 3), np.uint8,
+                                 buffer=self.shm.buf, offset=header_size)
+
+        if create:
+            self.generations[:] = -1
+            self.released[:] = -1
+
+    @staticmethod
+    def removeStale(name):
+        """Remove a block left behind by a previous run of the same camera"""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def attach(handle):
+        """Attach to the store that a handle was written to"""
+        return FrameStore(handle[STORE_NAME], handle[STORE_SEGMENTS], handle[STORE_FRAMES_PER_SEGMENT],
+                          handle[FRAME_WIDTH], handle[FRAME_HEIGHT], token=handle[STORE_TOKEN])
+
+    def write(self, frames, starting_frame_id, timeout=FRAME_STORE_TIMEOUT):
+        """
+        Copy a batch of frames into the next segment of the ring
+
+        Waits until the last node released the segment, so a slow pipeline holds the
+        camera back instead of having its frames overwritten.
+
+        Args:
+            frames: List of frames of the batch
+            starting_frame_id: Id of the first frame of the batch
+            timeout: Seconds to wait for the segment before reusing it anyway
+
+        Returns:
+            handle: Small dictionary that identifies the batch inside the store
+        """
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.segments
+
+        deadline = time() + timeout
+        while self.generations[slot] != self.released[slot] and time() < deadline:
+            sleep(0.005)
+
+        self.generations[slot] = -1
+        for index, frame in enumerate(frames):
+            self.frames[slot, index] = frame
+        self.generations[slot] = starting_frame_id
+
+        return {STORE_NAME: self.name,
+                STORE_TOKEN: self.token,
+                STORE_SEGMENTS: self.segments,
+                STORE_FRAMES_PER_SEGMENT: self.frames_per_segment,
+                STORE_SLOT: slot,
+                STORE_COUNT: len(frames),
+                STARTING_FRAME_ID: starting_frame_id,
+                FRAME_WIDTH: self.frame_width,
+                FRAME_HEIGHT: self.frame_height}
+
+    def read(self, handle):
+        """
+        Map the frames of a handle
+
+        Returns:
+            frames: Array of shape (count, height, width, 3) viewing the shared memory,
+                    or None if the segment was already overwritten by a newer batch
+        """
+        slot = handle[STORE_SLOT]
+        if self.generations[slot] != handle[STARTING_FRAME_ID]:
+            return None
+        return self.frames[slot, :handle[STORE_COUNT]]
+
+    def release(self, handle):
+        """Mark the segment of a handle as free once the last node is done with it"""
+        slot = handle[STORE_SLOT]
+        if self.generations[slot] == handle[STARTING_FRAME_ID]:
+            self.released[slot] = handle[STARTING_FRAME_ID]
+
+    def waitReleased(self, timeout=FRAME_STORE_TIMEOUT):
+        """Wait until the nodes released every written segment, or until the timeout"""
+        deadline = time() + timeout
+        while (self.generations != self.released).any() and time() < deadline:
+            sleep(0.005)
+
+    def close(self):
+        """Detach from the shared memory block"""
+        # views must be dropped before the block can be closed
+        self.generations = self.released = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # frames still viewed elsewhere keep the mapping until they are dropped
+
+    def unlink(self):
+        """Remove the shared memory block (camera side only)"""
+        self.shm.unlink()
@@ -0,0 +1,63 @@
+import numpy as np
+
+from System.Data.CONSTANTS import BATCH_OVERLAP_NO
+
+
+class FrameWindow:
+    """
+    Keeps the last frames of every camera's previous batch on a node, so consecutive
+    batches only need to carry the frames that were not sent before
+    """
+
+    def __init__(self, keep=BATCH_OVERLAP_NO):
+        """
+        Args:
+            keep: Number of frames kept from the end of each batch
+        """
+        self.keep = keep
+        self.tails = {}  # camera_id -> (id of the first kept frame, kept frames)
+        self.gaps = set()  # cameras whose last batch was dropped on this node
+
+    def extend(self, camera_id, starting_frame_id, new_frames, overlap, copy=False):
+        """
+        Rebuild a full batch from the kept frames and the newly received ones
+
+        When the node doesn't hold the overlapping frames (a batch was lost or the node
+        restarted) the batch is dropped: its detections are for frames the node doesn't
+        have. Its new frames are kept, so the next batch is full again, and that batch
+        is returned with no overlap, as the next nodes missed the dropped one too.
+
+        Args:
+            camera_id: Camera of the batch
+            starting_frame_id: Id of the first frame of the full batch
+            new_frames: Frames that were sent with the batch
+            overlap: Number of frames at the start of the batch that were not sent
+            copy: Whether the kept frames must be copied because their memory will be reused
+
+        Returns:
+            frames: The full batch, or None if it is dropped
+            overlap: Number of frames of the batch the next nodes already hold
+        """
+        frames = list(new_frames)
+        dropped = False
+        if overlap > 0:
+            tail = self.tails.get(camera_id)
+            offset = starting_frame_id - tail[0] if tail is not None else -1
+            if 0 <= offset and offset + overlap <= len(tail[1]):
+                frames = tail[1][offset:offset + overlap] + frames
+            else:
+                dropped = True
+                starting_frame_id += overlap
+
+        kept = frames[-self.keep:]
+        if copy:
+            kept = [np.array(frame) for frame in kept]
+        self.tails[camera_id] = (starting_frame_id + len(frames) - len(kept), kept)
+
+        if dropped:
+            self.gaps.add(camera_id)
+            return None, 0
+        if camera_id in self.gaps:
+            self.gaps.discard(camera_id)
+            overlap = 0
+        return frames, overlap
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+
+from System.Data.CONSTANTS import RAW_STORE_FRAMES_NO
+
+#header fields before the frame id of every record: frame height, width, channels and number of records
+HEADER_FIELDS = 4
+
+
+class RawSegmentStore:
+    """
+    Saved frames of every camera as raw fixed size records in one memory mapped file
+    per camera, instead of one MJPG video per segment.
+
+    A frame goes to record frame_id % frames_no, so the file never grows and the newest
+    frames_no frames of a camera are kept, the older ones being overwritten. The header
+    holds the id of the frame in every record, so frames are found without an index
+    file and stay readable after a restart. Reading gives views of the mapped file,
+    without decoding or copying.
+    """
+
+    def __init__(self, folder="saved_frames_vid", frames_no=RAW_STORE_FRAMES_NO):
+        """
+        Args:
+            folder: Folder of the camera files
+            frames_no: Number of records of every camera file (its retention window)
+        """
+        self.folder = folder
+        self.frames_no = frames_no
+        self.cameras = {}  # camera_id -> (frame id of every record, records)
+
+    def path(self, camera_id):
+        return os.path.join(self.folder, f"({camera_id}).raw")
+
+    def open(self, camera_id, frame_shape=None):
+        """
+        Map the file of a camera
+
+        Args:
+            camera_id: Camera of the file
+            frame_shape: Shape of the frames to write, None to only read an existing file
+
+        Returns:
+            (frame ids, records) of the camera, or None if there is nothing to read
+        """
+        store = self.cameras.get(camera_id)
+        if store is not None and (frame_shape is None or store[1].shape[1:] == tuple(frame_shape)):
+            return store
+
+        path = self.path(camera_id)
+        header_size = (HEADER_FIELDS + self.frames_no) * np.dtype(np.int64).itemsize
+        if store is None and os.path.exists(path) and os.path.getsize(path) >= header_size:
+            header = np.memmap(path, np.int64, "r", shape=(HEADER_FIELDS,))
+            shape, frames_no = tuple(int(size) for size in header[:3]), int(header[3])
+            del header
+            # a file of the same frames is reused, written before a restart
+            if frames_no == self.frames_no and (frame_shape is None or shape == tuple(frame_shape)) \
+                    and os.path.getsize(path) == header_size + frames_no * int(np.prod(shape)):
+                store = self.map(path, "r+", shape, header_size)
+                self.cameras[camera_id] = store
+                return store
+
+        if frame_shape is None:
+            return None
+
+        # new file, or the camera's frames changed size: start over
+        self.cameras.pop(camera_id, None)
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        store = self.map(path, "w+", tuple(frame_shape), header_size)
+        store[0][:] = -1
+        self.cameras[camera_id] = store
+        return store
+
+    def map(self, path, mode, frame_shape, header_size):
+        data = np.memmap(path, np.uint8, mode, shape=(header_size + self.frames_no * int(np.prod(frame_shape)),))
+        header = data[:header_size].view(np.int64)
+        if mode == "w+":
+            header[:HEADER_FIELDS] = frame_shape + (self.frames_no,)
+        frame_ids = header[HEADER_FIELDS:]
+        records = data[header_size:].reshape((self.frames_no,) + frame_shape)
+        return frame_ids, records
+
+    def write(self, camera_id, frames, starting_frame_id):
+        """
+        Save the frames of a segment
+
+        Args:
+            camera_id: Camera of the frames
+            frames: Frames of the segment
+            starting_frame_id: Id of the first frame
+        """
+        if len(frames) == 0:
+            return
+        frame_ids, records = self.open(camera_id, frames[0].shape)
+        for index, frame in enumerate(frames):
+            record = (starting_frame_id + index) % self.frames_no
+            # the frame first, so a record never has the id of a frame it doesn't hold yet
+            frame_ids[record] = -1
+            records[record] = frame
+            frame_ids[record] = starting_frame_id + index
+
+    def read(self, camera_id, starting_frame_id, no_of_frames):
+        """
+        Get saved frames as views of the camera file
+
+        Args:
+            camera_id: Camera of the frames
+            starting_frame_id: Id of the first frame
+            no_of_frames: Number of frames to read
+
+        Returns:
+            frames: The frames kept from the first one on, up to the first one that isn't, or None if the
+                first frame isn't kept. The views change when their records are reused, copy them to keep them.
+        """
+        store = self.open(camera_id)
+        if store is None:
+            return None
+        frame_ids, records = store
+
+        frames = []
+        for frame_id in range(starting_frame_id, starting_frame_id + no_of_frames):
+            if frame_ids[frame_id % self.frames_no] != frame_id:
+                break
+            frames.append(records[frame_id % self.frames_no])
+        return frames if len(frames) > 0 else None
@@ -0,0 +1,164 @@
+import os
+import queue
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from System.Data.CONSTANTS import PRE_FRAMES_NO, SEGMENT_RETENTION_GRACE_FRAMES
+from System.Data.RawSegmentStore import HEADER_FIELDS
+
+SEGMENT_FILE = re.compile(r"^\((.+)\) (\d+)\.avi$")
+RAW_FILE = re.compile(r"^\((.+)\)\.raw$")
+
+
+def cameraIdOf(name):
+    """Camera id as it was written in a file name, ids are ints unless they have other characters"""
+    return int(name) if name.isdigit() else name
+
+
+def newestRawFrameId(path):
+    """Id of the newest frame in a raw store file, -1 if it has none or can't be read"""
+    try:
+        header = np.memmap(path, np.int64, "r", shape=(HEADER_FIELDS,))
+        frames_no = int(header[3])
+        del header
+        frame_ids = np.memmap(path, np.int64, "r", offset=HEADER_FIELDS * np.dtype(np.int64).itemsize,
+                              shape=(frames_no,))
+        return int(frame_ids.max())
+    except Exception:
+        return -1
+
+
+class SegmentRetention:
+    """
+    Keeps only the saved segment videos of every camera that a crash clip may still need,
+    and deletes the others on a background thread
+
+    A crash clip starts PRE_FRAMES_NO batches before the crash batch, and crash results
+    come some batches after their frames were saved, so the segments of a camera that
+    start within keep_frames frames of its newest one are kept. The raw store file of a
+    camera goes the same way once its newest frame is out of that window, so a file left
+    by a run in raw store mode goes after the camera saved segments for a while, and the
+    segments left by a run in video mode go after the camera wrote its raw file for a while.
+    The files found on startup are managed like the saved ones, so the leftovers of an
+    earlier run go too. Disk usage of every camera is its kept segments plus its raw file.
+    """
+
+    def __init__(self, folder="saved_frames_vid", grace_frames=SEGMENT_RETENTION_GRACE_FRAMES):
+        """
+        Args:
+            folder: Folder of the saved segments
+            grace_frames: Frames kept beyond the crash pre-roll, for crash results that come late
+        """
+        self.folder = folder
+        self.keep_frames = (PRE_FRAMES_NO + 1) * 30 + grace_frames
+        self.segments = {}  # camera_id -> OrderedDict of segment_id -> file size, oldest first
+        self.raw_files = {}  # camera_id -> (id of its newest frame, file size)
+        self.lock = threading.Lock()
+        self.expired = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+        for camera_id, segment_id, size in sorted(self.scan(), key=lambda segment: segment[1]):
+            self.segments.setdefault(camera_id, OrderedDict())[segment_id] = size
+        for camera_id, newest_frame_id, size in self.scanRaw():
+            self.raw_files[camera_id] = (newest_frame_id, size)
+        self.thread.start()
+
+    def scan(self):
+        """Segments already in the folder, as (camera_id, segment_id, file size)"""
+        if not os.path.exists(self.folder):
+            return []
+        found = []
+        for entry in os.scandir(self.folder):
+            match = SEGMENT_FILE.match(entry.name)
+            if match is not None:
+                found.append((cameraIdOf(match.group(1)), int(match.group(2)), entry.stat().st_size))
+        return found
+
+    def scanRaw(self):
+        """Raw store files already in the folder, as (camera_id, id of the newest frame, file size)"""
+        if not os.path.exists(self.folder):
+            return []
+        found = []
+        for entry in os.scandir(self.folder):
+            match = RAW_FILE.match(entry.name)
+            if match is not None:
+                found.append((cameraIdOf(match.group(1)), newestRawFrameId(entry.path), entry.stat().st_size))
+        return found
+
+    def path(self, camera_id, segment_id):
+        return os.path.join(self.folder, f"({camera_id}) {segment_id}.avi")
+
+    def rawPath(self, camera_id):
+        return os.path.join(self.folder, f"({camera_id}).raw")
+
+    def add(self, camera_id, segment_id, size):
+        """
+        Account for a written segment and expire the files of its camera that aren't needed anymore
+
+        Args:
+            camera_id: Camera of the segment
+            segment_id: Id of the first frame of the segment, the newest of the camera
+            size: Size of the segment file
+        """
+        with self.lock:
+            segments = self.segments.setdefault(camera_id, OrderedDict())
+            segments.pop(segment_id, None)
+            segments[segment_id] = size
+            self.expire(camera_id, segment_id)
+
+    def addRaw(self, camera_id, frame_id, size):
+        """
+        Account for frames written to the raw store file of a camera and expire the segments
+        of the camera that aren't needed anymore
+
+        Args:
+            camera_id: Camera of the frames
+            frame_id: Id of the last frame written, the newest of the camera
+            size: Size of the raw store file
+        """
+        with self.lock:
+            self.raw_files[camera_id] = (frame_id, size)
+            self.expire(camera_id, frame_id)
+
+    def expire(self, camera_id, newest_id):
+        """Queue the deletion of the files of a camera out of the window ending at newest_id, with the lock held"""
+        # ids above the newest one are from an earlier run whose frame ids started over
+        oldest_kept = newest_id - self.keep_frames
+        segments = self.segments.get(camera_id, OrderedDict())
+        while len(segments) > 0:
+            oldest = next(iter(segments))
+            if oldest_kept <= oldest <= newest_id:
+                break
+            del segments[oldest]
+            self.expired.put(self.path(camera_id, oldest))
+
+        raw_file = self.raw_files.get(camera_id)
+        if raw_file is not None and not oldest_kept <= raw_file[0] <= newest_id:
+            del self.raw_files[camera_id]
+            self.expired.put(self.rawPath(camera_id))
+
+    def usage(self):
+        """
+        Disk usage of the saved frames of every camera
+
+        Returns:
+            dict of camera_id -> bytes of its kept segments and raw store file
+        """
+        with self.lock:
+            usage = {camera_id: sum(segments.values()) for camera_id, segments in self.segments.items()}
+            for camera_id, (_, size) in self.raw_files.items():
+                usage[camera_id] = usage.get(camera_id, 0) + size
+        return usage
+
+    def run(self):
+        while True:
+            path = self.expired.get()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error deleting expired file {path}: {e}")
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from System.Data.CONSTANTS import SEGMENT_RING_FRAMES_NO, SEGMENT_RING_BYTES
+
+
+class SegmentRing:
+    """
+    Keeps the last saved segments of every camera in memory on the master, so a crash
+    clip is assembled from the frames that just went through it instead of decoding
+    the segment videos again
+
+    Every camera keeps its last frames_no frames, and the oldest segments of all the
+    cameras are dropped when the ring holds more than max_bytes.
+    """
+
+    def __init__(self, frames_no=SEGMENT_RING_FRAMES_NO, max_bytes=SEGMENT_RING_BYTES):
+        """
+        Args:
+            frames_no: Number of frames kept per camera
+            max_bytes: Memory the frames of all the cameras may take
+        """
+        self.frames_no = frames_no
+        self.max_bytes = max_bytes
+        self.segments = OrderedDict()  # (camera_id, segment_id) -> frames, oldest first
+        self.frame_counts = {}  # camera_id -> number of frames kept
+        self.bytes = 0
+
+    def add(self, camera_id, segment_id, frames):
+        """
+        Keep the frames of a saved segment
+
+        Args:
+            camera_id: Camera of the segment
+            segment_id: Id of the first frame of the segment
+            frames: Frames of the segment, copied because the buffers of a batch are reused
+
+        Returns:
+            frames: The kept copies of the frames
+        """
+        key = (camera_id, segment_id)
+        if key in self.segments:
+            self.remove(key)
+
+        kept = [np.array(frame) for frame in frames]
+        self.segments[key] = kept
+        self.frame_counts[camera_id] = self.frame_counts.get(camera_id, 0) + len(kept)
+        self.bytes += sum(frame.nbytes for frame in kept)
+
+        # Drop the oldest segments of the camera, then the oldest of all the cameras
+        while self.frame_counts.get(camera_id, 0) > self.frames_no:
+            self.remove(next(key for key in self.segments if key[0] == camera_id))
+        while self.bytes > self.max_bytes:
+            self.remove(next(iter(self.segments)))
+        return kept
+
+    def get(self, camera_id, segment_id):
+        """
+        Get the frames of a segment
+
+        Returns:
+            frames: The kept frames, or None if the segment isn't in memory (too old or saved before a restart)
+        """
+        return self.segments.get((camera_id, segment_id))
+
+    def remove(self, key):
+        frames = self.segments.pop(key)
+        self.frame_counts[key[0]] -= len(frames)
+        if self.frame_counts[key[0]] == 0:
+            del self.frame_counts[key[0]]
+        self.bytes -= sum(frame.nbytes for frame in frames)
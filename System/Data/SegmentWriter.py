@@ -0,0 +1,73 @@
+import atexit
+import queue
+import threading
+
+from System.Data.CONSTANTS import SEGMENT_WRITER_THREADS, SEGMENT_WRITER_QUEUE_SIZE
+
+
+class SegmentWriter:
+    """
+    Encodes the saved segments of the master on background threads, so a FEED returns
+    as soon as its frames are queued instead of after they are written
+
+    Every camera always goes to the same thread, so its segments are written in the
+    order they were saved. Each thread has a bounded queue: when the disk can't keep up,
+    saving blocks instead of piling up frames. Queued segments are written before the
+    process exits.
+    """
+
+    def __init__(self, write, threads=SEGMENT_WRITER_THREADS, queue_size=SEGMENT_WRITER_QUEUE_SIZE):
+        """
+        Args:
+            write: Function writing a segment: write(camera_id, frames, segment_id, frame_width, frame_height)
+            threads: Number of writing threads, opencv encodes without holding the GIL
+            queue_size: Segments waiting per thread before saving blocks
+        """
+        self.write = write
+        self.queues = [queue.Queue(queue_size) for _ in range(threads)]
+        self.threads = [threading.Thread(target=self.run, args=(segments,), daemon=True) for segments in self.queues]
+        for thread in self.threads:
+            thread.start()
+        atexit.register(self.close)
+
+    def save(self, camera_id, frames, segment_id, frame_width, frame_height):
+        """
+        Queue a segment to be written
+
+        Args:
+            camera_id: Camera of the segment
+            frames: Frames of the segment, they must not change until they are written
+            segment_id: Id of the first frame of the segment
+            frame_width, frame_height: Size of the frames
+        """
+        self.queueOf(camera_id).put((camera_id, frames, segment_id, frame_width, frame_height))
+
+    def flush(self, camera_id=None):
+        """Wait until the queued segments of a camera, or of all the cameras, are written"""
+        for segments in self.queues if camera_id is None else [self.queueOf(camera_id)]:
+            segments.join()
+
+    def close(self):
+        """Write the queued segments and stop the threads"""
+        if not any(thread.is_alive() for thread in self.threads):
+            return
+        for segments in self.queues:
+            segments.put(None)
+        for thread in self.threads:
+            thread.join()
+        atexit.unregister(self.close)
+
+    def queueOf(self, camera_id):
+        return self.queues[hash(camera_id) % len(self.queues)]
+
+    def run(self, segments):
+        while True:
+            segment = segments.get()
+            try:
+                if segment is None:
+                    return
+                self.write(*segment)
+            except Exception as e:
+                print(f"Error writing segment {segment[2]} of camera {segment[0]}: {e}")
+            finally:
+                segments.task_done()
@@ -1,7 +1,16 @@
 import cv2
+import numpy as np
 
-from Mosse_Tracker.TrackerManager import TrackerType
 from System.Data.CONSTANTS import Work_Crash_Estimation_Only
+from System.Data.FrameContext import FrameContext
+
+#frames of the batch at which the predicted positions of every pair are compared
+CRASH_CHECK_FRAMES = (16, 19, 22, 25, 28)
+#fewer trackers are checked pair by pair without the broad phase
+BROAD_PHASE_MIN_TRACKERS = 64
+#key strides of the broad phase grid, more cells than any frame can span
+GRID_ROW = 1 << 20
+GRID_FRAME = 1 << 42
 
 
 class Crashing:
@@ -12,13 +21,14 @@ class Crashing:
     def __init__(self, vif):
         self.vif = vif
 
-    def crash(self, frames, trackers):
+    def crash(self, frames, trackers, context=None):
         """
         Main crash detection method that analyzes trackers for possible collisions
         
         Args:
             frames: List of video frames
             trackers: List of vehicle trackers
+            context: Frame context of the batch, shared by all the checked pairs
             
         Returns:
             tuple: (crash_dimensions, crash_frame, crash_frame_index)
@@ -29,33 +39,30 @@ class Crashing:
         crash_dimensions = []
         crash_frame = None
         crash_frame_index = None
+        if context is None:
+            context = FrameContext(frames)
 
-        # Check all tracker pairs for potential collisions
-        for i in range(len(trackers)):
-            for j in range(i + 1, len(trackers)):
-                if i == j:
-                    continue
-                    
-                tracker_A = trackers[i]
-                tracker_B = trackers[j]
-
-                # Calculate distance threshold based on vehicle sizes
-                asize = pow(pow(tracker_A.vehicle_height, 2) + pow(tracker_A.vehicle_width, 2), 0.5) * .25
-                bsize = pow(pow(tracker_B.vehicle_height, 2) + pow(tracker_B.vehicle_width, 2), 0.5) * .25
-                distance_threshold = asize + bsize
-
-                # Check for collisions at different time points
-                if (self.checkDistance(tracker_A, tracker_B, 16, distance_threshold) or
-                    self.checkDistance(tracker_A, tracker_B, 19, distance_threshold) or
-                    self.checkDistance(tracker_A, tracker_B, 22, distance_threshold) or
-                    self.checkDistance(tracker_A, tracker_B, 25, distance_threshold) or
-                    self.checkDistance(tracker_A, tracker_B, 28, distance_threshold)):
-                
-                    # Handle crash detection based on configuration
-                    if Work_Crash_Estimation_Only:
-                        self.crashEstimation(crash_dimensions, tracker_A, tracker_B, frames)
-                    else:
-                        crash_dimensions.extend(self.predict(frames, [tracker_B, tracker_A]))
+        # Distance under which two vehicles may collide depends on their sizes
+        sizes = np.array([pow(pow(tracker.vehicle_height, 2) + pow(tracker.vehicle_width, 2), 0.5) * .25
+                          for tracker in trackers])
+
+        # Check every pair at the different time points at once, then handle the colliding ones
+        pairs = self.collidingPairs(trackers, sizes)
+
+        # Every tracker of the colliding pairs is classified once, all of them in one batch
+        predictions = None
+        if not Work_Crash_Estimation_Only:
+            predictions = self.classify(context, [trackers[k] for k in sorted(set(k for pair in pairs for k in pair))])
+
+        for i, j in pairs:
+            tracker_A = trackers[i]
+            tracker_B = trackers[j]
+
+            # Handle crash detection based on configuration
+            if Work_Crash_Estimation_Only:
+                self.crashEstimation(crash_dimensions, tracker_A, tracker_B, context)
+            else:
+                crash_dimensions.extend(self.predict(context, [tracker_B, tracker_A], predictions))
 
         # Combine crash areas if multiple crashes detected and create crash frame
         if len(crash_dimensions) > 0:
@@ -88,71 +95,191 @@ class Crashing:
 
         return crash_dimensions, crash_frame, crash_frame_index
 
-    def checkDistance(self, tracker_A, tracker_B, frame_no, distance_threshold):
+    def trackArrays(self, trackers):
         """
-        Check if two trackers are in collision at a specific frame
+        Export what the collision checks read from the trackers into arrays
         
         Args:
-            tracker_A, tracker_B: The two trackers to check
-            frame_no: The frame number to check
-            distance_threshold: Minimum distance for collision
+            trackers: List of vehicle trackers
             
         Returns:
-            bool: True if collision detected, False otherwise
+            tuple: (predicted, actual, fast) at every checked frame
+                - predicted: (trackers, frames, 2) predicted centers, nan where there is no prediction
+                - actual: (trackers, frames, 2) tracked centers
+                - fast: (trackers, frames) whether the vehicle is above the speed limit before the frame
         """
-        # Skip if neither vehicle is moving fast enough
-        if not tracker_A.isAboveSpeedLimit(frame_no - 10, frame_no) and not tracker_B.isAboveSpeedLimit(frame_no - 10, frame_no):
-            return False
+        predicted = np.full((len(trackers), len(CRASH_CHECK_FRAMES), 2), np.nan)
+        actual = np.full((len(trackers), len(CRASH_CHECK_FRAMES), 2), np.nan)
+
+        # running sums of the moves (dx, dy) of every tracker, with the sum before its first move
+        no_of_moves = np.array([len(tracker.getMoves()[0]) for tracker in trackers], np.int64)
+        move_sums = np.zeros((len(trackers), 2, no_of_moves.max(initial=0) + 1))
+        areas = np.empty(len(trackers))
 
-        # Get predicted positions
-        xa, ya = tracker_A.estimationFutureCenter[frame_no]
-        xb, yb = tracker_B.estimationFutureCenter[frame_no]
+        frame_nos = np.array(CRASH_CHECK_FRAMES)
+        for index, tracker in enumerate(trackers):
+            dx_change, dy_change = tracker.getMoves()
+            np.cumsum(dx_change.view(), out=move_sums[index, 0, 1:no_of_moves[index] + 1])
+            np.cumsum(dy_change.view(), out=move_sums[index, 1, 1:no_of_moves[index] + 1])
+            areas[index] = tracker.getArea()
+
+            estimated = frame_nos < len(tracker.estimationFutureCenter)
+            predicted[index, estimated] = tracker.estimationFutureCenter.view()[frame_nos[estimated]]
+
+            tracked = frame_nos < len(tracker.getCenters())
+            actual[index, tracked] = tracker.getCenters().view()[frame_nos[tracked]]
+
+        # average speed over the 10 moves before every checked frame, as isAboveSpeedLimit computes it
+        stops = np.minimum(frame_nos, no_of_moves[:, None])
+        starts = np.minimum(frame_nos - 10, stops)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            moves = (np.take_along_axis(move_sums, stops[:, None], 2) - np.take_along_axis(move_sums, starts[:, None], 2)) \
+                    / (stops - starts)[:, None]
+            r = np.power(moves[:, 0] * moves[:, 0] + moves[:, 1] * moves[:, 1], 0.5)
+            fast = r * (43200 / areas)[:, None] > 50
+
+        return predicted, actual, fast
+
+    def candidatePairs(self, predicted, sizes):
+        """
+        Broad phase of the collision checks using a uniform grid over the predicted centers
+        
+        A pair can only collide at a checked frame if its predicted centers are within
+        the sum of the vehicle sizes there, so with cells as large as the largest such
+        distance only trackers in neighbouring cells need to be compared.
         
-        # Calculate distance between predicted positions
-        r = pow(pow(xa - xb, 2) + pow(ya - yb, 2), 0.5)
-
-        # Direct collision if distance is zero
-        if r == 0:
-            return True
-        # Not a collision if distance is greater than threshold
-        elif r > distance_threshold:
-            return False
-
-        # Get actual positions
-        if tracker_A.tracker_type == TrackerType.MOSSE:
-            xa_actual, ya_actual = tracker_A.tracker.centers[frame_no]
-            xb_actual, yb_actual = tracker_B.tracker.centers[frame_no]
-        else:
-            xa_actual, ya_actual = tracker_A.get_position(tracker_A.history[frame_no])
-            xb_actual, yb_actual = tracker_B.get_position(tracker_B.history[frame_no])
+        Args:
+            predicted: (trackers, frames, 2) predicted centers
+            sizes: Collision distance of every tracker
             
-        # Calculate difference between actual and predicted positions
-        difference_trackerA_actual_to_estimate = pow(pow(xa_actual - xa, 2) + pow(ya_actual - ya, 2), 0.5)
-        difference_trackerB_actual_to_estimate = pow(pow(xb_actual - xb, 2) + pow(yb_actual - yb, 2), 0.5)
-        max_difference = max(difference_trackerA_actual_to_estimate, difference_trackerB_actual_to_estimate)
+        Returns:
+            tuple: (first, second) index arrays of the sorted pairs, first < second
+        """
+        no_of_trackers = len(sizes)
+        cell_size = 2 * sizes.max() if no_of_trackers > 0 else 0
+        if no_of_trackers < BROAD_PHASE_MIN_TRACKERS or not cell_size > 0:
+            return np.triu_indices(no_of_trackers, 1)
+
+        # cell of every placed tracker at every checked frame, the frames kept apart in the keys
+        tracker_indexes, frame_indexes = np.nonzero(~np.isnan(predicted).any(axis=2))
+        cells = np.floor_divide(predicted[tracker_indexes, frame_indexes], cell_size).astype(np.int64)
+        cell_keys = frame_indexes * GRID_FRAME + cells[:, 0] * GRID_ROW + cells[:, 1]
+
+        # sorted by cell, the trackers of any cell are one range of the order
+        order = np.argsort(cell_keys, kind="stable")
+        sorted_keys = cell_keys[order]
+
+        keys = []
+        for neighbour_x in (-1, 0, 1):
+            for neighbour_y in (-1, 0, 1):
+                neighbour_keys = cell_keys + neighbour_x * GRID_ROW + neighbour_y
+                start = np.searchsorted(sorted_keys, neighbour_keys, "left")
+                counts = np.searchsorted(sorted_keys, neighbour_keys, "right") - start
+
+                # pair every tracker with every tracker of the neighbouring cell
+                first = np.repeat(tracker_indexes, counts)
+                positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - start, counts)
+                second = tracker_indexes[order[positions]]
+                keys.append(first[first < second] * no_of_trackers + second[first < second])
 
-        # If the difference is significant compared to the distance, consider it a collision
-        return max_difference / r > 0.5
+        keys = np.unique(np.concatenate(keys))
+        return keys // no_of_trackers, keys % no_of_trackers
 
-    def predict(self, frames_RGB, trackers):
+    def collidingPairs(self, trackers, sizes):
+        """
+        Check the tracker pairs for collisions at all the checked frames
+        
+        A pair collides at a frame if one of the vehicles is above the speed limit and
+        their predicted centers either meet or are within the collision distance while
+        one of them is far from where it was predicted to be.
+        
+        Args:
+            trackers: List of vehicle trackers
+            sizes: Collision distance of every tracker
+            
+        Returns:
+            list: Sorted (i, j) index pairs, i < j, of the colliding trackers
+        """
+        predicted, actual, fast = self.trackArrays(trackers)
+        first, second = self.candidatePairs(predicted, sizes)
+
+        # distance between the predicted positions of every pair at every frame
+        delta = predicted[first] - predicted[second]
+        r = np.power(delta[..., 0] * delta[..., 0] + delta[..., 1] * delta[..., 1], 0.5)
+
+        # how far every vehicle is from where it was predicted to be
+        error = actual - predicted
+        difference = np.power(error[..., 0] * error[..., 0] + error[..., 1] * error[..., 1], 0.5)
+        max_difference = np.maximum(difference[first], difference[second])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deviated = max_difference / r > 0.5
+        near = r <= (sizes[first] + sizes[second])[:, None]
+        colliding = (fast[first] | fast[second]) & ((r == 0) | (near & deviated))
+
+        hits = colliding.any(axis=1)
+        return list(zip(first[hits].tolist(), second[hits].tolist()))
+
+    def predict(self, context, trackers, predictions=None):
         """
         Use VIF model to predict if a crash occurred
         
         Args:
-            frames_RGB: List of color video frames
+            context: Frame context of the batch
             trackers: List of vehicle trackers
+            predictions: Result of classify for these trackers, computed here by default
             
         Returns:
             crash_dimensions: Coordinates of crash areas
         """
-        gray_frames = self.convertToGrayFrames(frames_RGB)
+        if predictions is None:
+            predictions = self.classify(context, trackers)
         no_crash = 0
         crash = 0
         crash_dimensions = []
         
+        for tracker in trackers:
+            box, result = predictions[tracker]
+            crash_dimensions.append(box)
+
+            # Skip if the tracker couldn't be classified
+            if result is None:
+                continue
+
+            if result == 0.0:
+                no_crash += 1
+            else:
+                crash += 1
+                tracker.saveTracking(context.frames)
+
+        # Return empty list if no crash detected
+        if crash == 0:
+            crash_dimensions = []
+            
+        return crash_dimensions
+
+    def classify(self, context, trackers):
+        """
+        Run the VIF model on the tracked areas of the trackers, all of them in one batch
+        
+        Args:
+            context: Frame context of the batch
+            trackers: List of vehicle trackers
+            
+        Returns:
+            dict: tracker -> ([xmin, ymin, xmax, ymax], result), result is None when the
+                tracker has too few frames or its area is too small to classify
+        """
+        gray_frames = context.grayFrames()
+        shape = (self.vif.cols, self.vif.rows)
+        predictions = {}
+        classified = []
+        frame_sets = []
+        flow_caches = []
+
         for tracker in trackers:
             tracker_frames, width, height, xmin, xmax, ymin, ymax = tracker.getFramesOfTracking(gray_frames)
-            crash_dimensions.append([xmin, ymin, xmax, ymax])
+            predictions[tracker] = ([xmin, ymin, xmax, ymax], None)
 
             # Skip if frames couldn't be extracted or frame is too small
             if tracker_frames is None:
@@ -164,48 +291,42 @@ class Crashing:
             if (ymax - ymin) / (xmax - xmin) < 0.35:
                 continue
 
-            # Run crash prediction model
-            feature_vec = self.vif.process(tracker_frames)
-            result = self.vif.clf.predict(feature_vec.reshape(1, 304))
-            
-            if result[0] == 0.0:
-                no_crash += 1
-            else:
-                crash += 1
-                tracker.saveTracking(frames_RGB)
+            # Crops resized once per batch, a tracker in several pairs reuses the optical flow of its first pair
+            first = len(gray_frames) - len(tracker_frames)
+            classified.append(tracker)
+            frame_sets.append(context.resizedFrames([xmin, ymin, xmax, ymax], shape, first))
+            flow_caches.append(context.flowCache([xmin, ymin, xmax, ymax], shape, first))
 
-        # Return empty list if no crash detected
-        if crash == 0:
-            crash_dimensions = []
-            
-        return crash_dimensions
+        if len(classified) == 0:
+            return predictions
 
-    def convertToGrayFrames(self, frames_RGB):
-        """Convert RGB frames to grayscale"""
-        gray_frames = []
-        for frame in frames_RGB:
-            gray_frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
-        return gray_frames
+        # Run crash prediction model on the features of all the trackers
+        feature_vecs = self.vif.process_batch(frame_sets, flow_caches)
+        results = self.vif.clf.predict(np.array(feature_vecs).reshape(len(classified), 304))
+        for tracker, result in zip(classified, results):
+            predictions[tracker] = (predictions[tracker][0], result)
 
-    def crashEstimation(self, crash_dimensions, tracker_A, tracker_B, frames):
+        return predictions
+
+    def crashEstimation(self, crash_dimensions, tracker_A, tracker_B, context):
         """
         Estimate crash dimensions based on trackers without using VIF model
         
         Args:
             crash_dimensions: List to store crash areas
             tracker_A, tracker_B: The two trackers involved in crash
-            frames: List of video frames
+            context: Frame context of the batch
         """
         # Process first tracker
         tracker_frames, width, height, xmin, xmax, ymin, ymax = tracker_A.getFramesOfTracking(
-            self.convertToGrayFrames(frames))
+            context.grayFrames())
             
         if not (xmax - xmin < 50 or ymax - ymin <= 28 or (ymax - ymin) / (xmax - xmin) < 0.35):
             crash_dimensions.extend([[xmin, ymin, xmax, ymax]])
             
         # Process second tracker
         tracker_frames, width, height, xmin, xmax, ymin, ymax = tracker_B.getFramesOfTracking(
-            self.convertToGrayFrames(frames))
+            context.grayFrames())
             
         if not (xmax - xmin < 50 or ymax - ymin <= 28 or (ymax - ymin) / (xmax - xmin) < 0.35):
             crash_dimensions.extend([[xmin, ymin, xmax, ymax]])
\ No newline at end of file
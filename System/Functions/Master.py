@@ -8,6 +8,10 @@ from System.Controller.JsonEncoder import JsonEncoder
 from System.Data.CONSTANTS import *
 from System.Notifications.twilio_handler import TwilioHandler
 from System.Data.Database import CrashDatabase
+from System.Data.RawSegmentStore import RawSegmentStore
+from System.Data.SegmentRetention import SegmentRetention
+from System.Data.SegmentRing import SegmentRing
+from System.Data.SegmentWriter import SegmentWriter
 
 
 class Master:
@@ -16,7 +20,10 @@ class Master:
         self.twilio_handler = TwilioHandler()
         self.crash_database = CrashDatabase()
         self.crash_records = []
-        self.saved_frames = {}  # camera_id -> {frame_id -> frames}
+        self.segment_ring = SegmentRing()  # last saved segments of every camera, in memory for crash clips
+        self.segment_writer = SegmentWriter(self.write) if Work_Async_Segment_Writer else None
+        self.raw_store = RawSegmentStore() if Work_Raw_Segment_Store else None
+        self.segment_retention = SegmentRetention() if Work_Segment_Retention else None
         
         # Create directory for saved videos if it doesn't exist
         if not os.path.exists('saved_crash_vid'):
@@ -27,14 +34,38 @@ class Master:
         # Load crash records on startup
         self._load_crash_records()
 
-    def saveFrames(self, camera_id, starting_frame_id, frames, frame_width, frame_height):
-        """Store frames in file system"""
-        self.write(camera_id, frames, starting_frame_id, frame_width, frame_height, False)
-        
-        # Store frame info in memory
-        if camera_id not in self.saved_frames:
-            self.saved_frames[camera_id] = {}
-        self.saved_frames[camera_id][starting_frame_id] = True
+    def saveFrames(self, camera_id, starting_frame_id, frames, frame_width, frame_height, overlap=0):
+        """Store frames in file system, and keep them in memory for crash clips"""
+        if not Work_Sliding_Window_Frames:
+            self.saveSegment(camera_id, starting_frame_id, frames, frame_width, frame_height)
+            return
+
+        # Only the frames that weren't saved with the previous batch are written, in fixed size segments
+        for index in range(overlap, len(frames), SEGMENT_FRAMES_NO):
+            segment_id = starting_frame_id + index
+            self.saveSegment(camera_id, segment_id, frames[index:index + SEGMENT_FRAMES_NO], frame_width, frame_height)
+
+    def saveSegment(self, camera_id, segment_id, frames, frame_width, frame_height):
+        """Keep a segment in memory and write it, on the writer threads in async writer mode"""
+        if self.raw_store is not None:
+            # copying the frames into the mapped file is all there is to do, it also serves the crash clips
+            self.raw_store.write(camera_id, frames, segment_id)
+            if self.segment_retention is not None and len(frames) > 0:
+                self.segment_retention.addRaw(camera_id, segment_id + len(frames) - 1,
+                                              os.path.getsize(self.raw_store.path(camera_id)))
+            return
+
+        kept_frames = self.segment_ring.add(camera_id, segment_id, frames)
+        if self.segment_writer is None:
+            self.write(camera_id, frames, segment_id, frame_width, frame_height, False)
+        else:
+            # the kept copies don't change, unlike the buffers of the batch
+            self.segment_writer.save(camera_id, kept_frames, segment_id, frame_width, frame_height)
+
+    def close(self):
+        """Write the queued segments before the master stops"""
+        if self.segment_writer is not None:
+            self.segment_writer.close()
 
     def write(self, camera_id, frames, starting_frame_id, frame_width, frame_height, is_crash=False):
         """Write frames to video file"""
@@ -51,6 +82,13 @@ class Master:
             
         out.release()
 
+        if not is_crash and self.segment_retention is not None:
+            self.segment_retention.add(camera_id, starting_frame_id, os.path.getsize(file_path))
+
+    def diskUsage(self):
+        """Bytes of saved frames on disk per camera, None without retention"""
+        return self.segment_retention.usage() if self.segment_retention is not None else None
+
     def getVideoFrames(self, camera_id, frame_id, is_crash=False):
         """Retrieve frames from video file"""
         folder = "saved_crash_vid" if is_crash else "saved_frames_vid"
@@ -71,18 +109,25 @@ class Master:
     def recordCrash(self, camera_id, starting_frame_id, crash_dimensions):
         """Record crash event with visual marking"""
         new_frames = []
-        from_no_of_times = PRE_FRAMES_NO
+        segment_frames_no = SEGMENT_FRAMES_NO if Work_Sliding_Window_Frames else 30
 
-        # Collect frames from previous segments
-        while from_no_of_times >= 0:
-            last_frames = from_no_of_times * 30
-            new_frames_id = starting_frame_id - last_frames
+        # Collect frames from previous segments up to the end of the crash batch,
+        # from memory when they are still kept and from their videos otherwise
+        new_frames_id = starting_frame_id - PRE_FRAMES_NO * 30
+        while new_frames_id < starting_frame_id + 30:
             if new_frames_id > 0:
-                new_frames.extend(self.getVideoFrames(camera_id, new_frames_id, False))
-                frame_width = len(new_frames[0][0])
-                frame_height = len(new_frames[0])
+                segment_frames = self.segment_ring.get(camera_id, new_frames_id)
+                if segment_frames is None and self.raw_store is not None:
+                    segment_frames = self.raw_store.read(camera_id, new_frames_id, segment_frames_no)
+                if segment_frames is None:
+                    if self.segment_writer is not None:
+                        self.segment_writer.flush(camera_id)
+                    segment_frames = self.getVideoFrames(camera_id, new_frames_id, False)
+                new_frames.extend(segment_frames)
+            new_frames_id += segment_frames_no
 
-            from_no_of_times -= 1
+        frame_width = len(new_frames[0][0])
+        frame_height = len(new_frames[0])
 
         # Unpack crash dimensions
         xmin, ymin, xmax, ymax = crash_dimensions
@@ -98,6 +143,7 @@ class Master:
         # Mark crash in earlier frames
         if len(new_frames) >= 60:
             for i in range(len(new_frames) - 60, len(new_frames) - 30, 6):
+                new_frames[i] = new_frames[i].copy()  # the kept frames are shared with later clips
                 cv2.rectangle(new_frames[i], (xmin, ymin), (xmax, ymax), (0, 0, 255), -1)
                 cv2.putText(new_frames[i], "Crash!", (12, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 4)
             no_of_frames = 3
@@ -105,6 +151,7 @@ class Master:
         # Mark crash in recent frames
         for i in range(len(new_frames) - 30, len(new_frames), 1):
             fill = -1 if i % 2 == 0 else 2
+            new_frames[i] = new_frames[i].copy()
             cv2.rectangle(new_frames[i], (xmin, ymin), (xmax, ymax), (0, 0, 255), fill)
             cv2.putText(new_frames[i], "Crash!", (12, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 4)
 
@@ -364,8 +411,9 @@ class Master:
             }
             list_results.append(sending_msg)
 
+        # the bytes of saved frames of every camera go with the results, for the GUI to show
         jsonEncoder = JsonEncoder()
-        jsonEncoder.replyQuery(list_results)
+        jsonEncoder.replyQuery(list_results, self.diskUsage())
 
     def getCrashPhoto(self, camera_id, starting_frame_id):
         """Extract a frame from crash video for thumbnail"""
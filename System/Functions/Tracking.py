@@ -1,50 +1,171 @@
-import cv2
-
+from Mosse_Tracker.MultiMosse import MultiMOSSE
 from Mosse_Tracker.TrackerManager import Tracker, TrackerType
-from System.Data.CONSTANTS import Work_Tracker_Type_Mosse
+from System.Data.FrameContext import FrameContext
+from System.Data.CONSTANTS import Work_Tracker_Type_Mosse, Work_Tracker_Batched_Mosse, TRACK_MATCH_IOU
 
 
 class Tracking:
     def __init__(self):
-        pass
+        self.multi_mosse = MultiMOSSE()
 
-    def track(self, frames, boxes, frame_width, frame_height):
+    def track(self, frames, boxes, frame_width, frame_height, context=None):
         trackers = []
         trackerId = 0
-        frame = frames[0]
-        
+        if context is None:
+            context = FrameContext(frames)
+        frame_gray = context.gray(0)
+
         # Initialize a tracker for each detected box
         for _, box in enumerate(boxes):
-            # Extract box coordinates
-            xmin = int(box[1])
-            xmax = int(box[2])
-            ymin = int(box[3])
-            ymax = int(box[4])
-
-            # Convert to grayscale for tracking
-            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             trackerId += 1
-            
-            # Ensure coordinates are within frame boundaries
-            xmax = min(xmax, frame_width - 1)
-            ymax = min(ymax, frame_height - 1)
-
-            # Create appropriate tracker type based on settings
-            if Work_Tracker_Type_Mosse:
-                trackers.append(Tracker(frame_gray, (xmin, ymin, xmax, ymax), 
-                                        frame_width, frame_height, trackerId, TrackerType.MOSSE))
-            else:
-                trackers.append(Tracker(frame_gray, (xmin, ymin, xmax, ymax), 
-                                        frame_width, frame_height, trackerId, TrackerType.DLIB))
+            trackers.append(self.createTracker(frame_gray, box, frame_width, frame_height, trackerId))
 
         # Update trackers for each subsequent frame
         for i in range(1, len(frames)):
-            frame = frames[i]
-            frame_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            frame_gray = context.gray(i)
 
             # Update each tracker with the new frame
+            self.updateTrackers(trackers, frame_gray)
+
+        return trackers
+
+    def updateTrackers(self, trackers, frame_gray):
+        """Update trackers to the next frame and estimate their future positions"""
+        if Work_Tracker_Batched_Mosse:
+            # MOSSE trackers are updated together, grouped by patch size
+            mosse_trackers = [tracker for tracker in trackers if tracker.tracker_type == TrackerType.MOSSE]
+            self.multi_mosse.updateTracking([tracker.tracker for tracker in mosse_trackers], frame_gray,
+                                            [tracker.isStopped() for tracker in mosse_trackers])
+            for tracker in trackers:
+                if tracker.tracker_type == TrackerType.MOSSE:
+                    tracker.addHistory(tracker.tracker.getCutFramePosition())
+                else:
+                    tracker.update(frame_gray)
+        else:
             for tracker in trackers:
                 tracker.update(frame_gray)
-                tracker.futureFramePosition()
 
-        return trackers
\ No newline at end of file
+        for tracker in trackers:
+            tracker.futureFramePosition()
+
+    def summaries(self, trackers):
+        """Compact summaries of the trackers, all that crash detection needs from them"""
+        return [tracker.summary() for tracker in trackers]
+
+    def getBoxPosition(self, box, frame_width, frame_height):
+        """Get the (xmin, ymin, xmax, ymax) of a detected box within the frame boundaries"""
+        # Extract box coordinates
+        xmin = int(box[1])
+        xmax = int(box[2])
+        ymin = int(box[3])
+        ymax = int(box[4])
+
+        # Ensure coordinates are within frame boundaries
+        xmax = min(xmax, frame_width - 1)
+        ymax = min(ymax, frame_height - 1)
+        return xmin, ymin, xmax, ymax
+
+    def createTracker(self, frame_gray, box, frame_width, frame_height, trackerId):
+        """Initialize a tracker on a detected box of the first gray frame"""
+        # Create appropriate tracker type based on settings
+        if Work_Tracker_Type_Mosse:
+            return Tracker(frame_gray, self.getBoxPosition(box, frame_width, frame_height),
+                           frame_width, frame_height, trackerId, TrackerType.MOSSE)
+        else:
+            return Tracker(frame_gray, self.getBoxPosition(box, frame_width, frame_height),
+                           frame_width, frame_height, trackerId, TrackerType.DLIB)
+
+
+class TrackingSession(Tracking):
+    """
+    Tracking of one camera that keeps its trackers alive from batch to batch.
+
+    Consecutive batches overlap, so a vehicle that is still detected keeps its tracker,
+    filter and id, and only the frames that weren't tracked with the previous batch are
+    tracked again. Filters are only trained for newly detected vehicles.
+    """
+
+    def __init__(self):
+        Tracking.__init__(self)
+        self.trackers = []
+        self.starting_frame_id = None
+        self.no_of_frames = 0
+        self.next_tracker_id = 1
+
+    def track(self, frames, boxes, frame_width, frame_height, starting_frame_id=None, context=None):
+        """
+        Track the vehicles of the next batch of the camera
+
+        Args:
+            frames: Frames of the batch
+            boxes: Vehicles detected in the first frame of the batch
+            frame_width, frame_height: Size of the frames
+            starting_frame_id: Id of the first frame of the batch
+            context: Frame context of the batch
+
+        Returns:
+            trackers: Trackers of the batch, indexed by frame of this batch
+        """
+        if context is None:
+            context = FrameContext(frames)
+
+        # Frames of this batch that were already tracked with the previous one
+        overlap = 0
+        if self.starting_frame_id is not None and starting_frame_id is not None:
+            offset = starting_frame_id - self.starting_frame_id
+            if offset > 0:
+                overlap = max(self.no_of_frames - offset, 0)
+
+        previous_trackers = []
+        if overlap > 0:
+            for tracker in self.trackers:
+                tracker.rebase(self.no_of_frames - overlap)
+                previous_trackers.append(tracker)
+
+        # Keep the trackers that still cover a detected vehicle, start new ones for the rest
+        trackers = []
+        for box in boxes:
+            tracker = self.matchTracker(previous_trackers, self.getBoxPosition(box, frame_width, frame_height))
+            if tracker is None:
+                tracker = self.createTracker(context.gray(0), box, frame_width, frame_height, self.next_tracker_id)
+                self.next_tracker_id += 1
+            else:
+                previous_trackers.remove(tracker)
+            trackers.append(tracker)
+
+        # Update every tracker on the frames it hasn't tracked yet
+        for i in range(1, len(frames)):
+            outdated_trackers = [tracker for tracker in trackers if len(tracker.getHistory()) <= i]
+            if len(outdated_trackers) == 0:
+                continue
+            self.updateTrackers(outdated_trackers, context.gray(i))
+
+        self.trackers = trackers
+        self.starting_frame_id = starting_frame_id
+        self.no_of_frames = len(frames)
+        return trackers
+
+    def matchTracker(self, trackers, position):
+        """Find the tracker whose position on the first frame overlaps a detected box the most"""
+        best_tracker = None
+        best_iou = TRACK_MATCH_IOU
+        for tracker in trackers:
+            iou = self.intersectionOverUnion(tracker.getHistory()[0], position)
+            if iou >= best_iou:
+                best_tracker = tracker
+                best_iou = iou
+        return best_tracker
+
+    def intersectionOverUnion(self, position_A, position_B):
+        """Overlap ratio of two (xmin, ymin, xmax, ymax) boxes"""
+        xmin = max(position_A[0], position_B[0])
+        ymin = max(position_A[1], position_B[1])
+        xmax = min(position_A[2], position_B[2])
+        ymax = min(position_A[3], position_B[3])
+        intersection = max(xmax - xmin, 0) * max(ymax - ymin, 0)
+        area_A = (position_A[2] - position_A[0]) * (position_A[3] - position_A[1])
+        area_B = (position_B[2] - position_B[0]) * (position_B[3] - position_B[1])
+        union = area_A + area_B - intersection
+        if union <= 0:
+            return 0
+        return intersection / union
@@ -1,35 +1,51 @@
+import multiprocessing
 import threading
 
 # Using enum class create enumerations
 from System.Connections.ReceiverController import ReceiverController
-from System.Data.CONSTANTS import Work_Detect_Files
+from System.Connections.StageDispatcher import StageDispatcher
+from System.Data.CONSTANTS import *
 from System.NodeType import NodeType
 
 
+#number of worker processes of every stage in the push/pull pipeline
+STAGE_WORKERS = {NodeType.Master: 1,
+                 NodeType.Detetion: DETECT_WORKERS,
+                 NodeType.Tracking: TRACK_WORKERS,
+                 NodeType.Crashing: CRASH_WORKERS}
+
+
+def runWorker(node_type, port, worker_link):
+    #entry point of a stage worker process
+    Node(node_type, port).receiver(worker_link).run()
 
 
 class Node(threading.Thread):
-    def __init__(self,node_type, port):
+    def __init__(self,node_type, port, workers=None):
         threading.Thread.__init__(self)
         self.port = port
         self.node_type = node_type
+        self.workers = STAGE_WORKERS[node_type] if workers is None else workers
 
-    def run(self):
+    def receiver(self, worker_link=None):
         if self.node_type == NodeType.Master:
-            ReceiverController(self.port,type = NodeType.Master).run()
-            pass
+            return ReceiverController(self.port,type = NodeType.Master, worker_link=worker_link)
         elif self.node_type == NodeType.Detetion:
-            ReceiverController(self.port,type = NodeType.Detetion, read_file=Work_Detect_Files, tf=True).run()
-            pass
+            return ReceiverController(self.port,type = NodeType.Detetion, read_file=Work_Detect_Files, tf=True, worker_link=worker_link)
         elif self.node_type == NodeType.Tracking:
-            ReceiverController(self.port,type = NodeType.Tracking).run()
-            pass
+            return ReceiverController(self.port,type = NodeType.Tracking, worker_link=worker_link)
         elif self.node_type == NodeType.Crashing:
-            ReceiverController(self.port,type = NodeType.Crashing).run()
-            pass
-
-
-
+            return ReceiverController(self.port,type = NodeType.Crashing, worker_link=worker_link)
 
+    def run(self):
+        if not Work_Pipeline_Push_Pull:
+            self.receiver().run()
+            return
 
+        # every worker pulls its share of the stage's cameras from the dispatcher
+        worker_links = ["tcp://127.0.0.1:%s" % (int(self.port) + WORKER_PORT_STRIDE * (index + 1))
+                        for index in range(self.workers)]
+        for worker_link in worker_links:
+            multiprocessing.Process(target=runWorker, args=(self.node_type, self.port, worker_link), daemon=True).start()
 
+        StageDispatcher(self.port, worker_links).run()
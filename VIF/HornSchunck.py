@@ -16,6 +16,9 @@ windowY = np.array([[-1, -1],
 
 windowT = np.ones((2, 2)) * .25
 
+#frame pairs stacked into one image by HornSchunckCV.process_batch, larger stacks fall out of the cpu caches
+MAX_BATCH_SIZE = 4
+
 
 class HornSchunck:
     def process(self, frame1, frame2, alpha=0.001, NumOfIter=8):
@@ -63,6 +66,22 @@ class HornSchunck:
 
         return H, V, M
 
+    def process_batch(self, frames1, frames2, alpha=0.001, NumOfIter=8):
+        """
+        Compute optical flow of many frame pairs using Horn-Schunck method
+
+        Parameters:
+        frames1: frames at t=0
+        frames2: frames at t=1, one for every frame of frames1
+        alpha: regularization constant
+        NumOfIter: number of iteration
+
+        Returns:
+        H, V, M: (pairs, rows, cols) flow components and magnitudes of every pair
+        """
+        flows = [self.process(frame1, frame2, alpha, NumOfIter) for frame1, frame2 in zip(frames1, frames2)]
+        return tuple(np.array(flow) for flow in zip(*flows))
+
     def derivatives(self, frame1, frame2):
         """Calculate spatial and temporal derivatives"""
         fx = filter2(frame1, windowX) + filter2(frame2, windowX)
@@ -86,6 +105,199 @@ class HornSchunck:
         return im2
 
 
+class HornSchunckCV(HornSchunck):
+    """
+    Horn-Schunck optical flow computed in float32 with cv2.filter2D
+
+    Same method and results (up to float32 rounding) as HornSchunck, without scipy and float64:
+    the derivative kernels are flipped so the correlation of filter2D is the convolution of scipy,
+    and the buffers of a frame size are allocated once and updated in place.
+    """
+
+    def __init__(self):
+        self.buffers = {}  # (rows, cols) -> float32 buffers of the iterations
+        self.kernelX = cv2.flip(windowX, -1).astype(np.float32)
+        self.kernelY = cv2.flip(windowY, -1).astype(np.float32)
+        self.kernelT = windowT.astype(np.float32)
+        self.kernelAvg = windowAvg.astype(np.float32)
+
+    def getBuffers(self, shape):
+        """Get the buffers for frames of the given shape"""
+        if shape not in self.buffers:
+            self.buffers[shape] = [np.empty(shape, np.float32) for _ in range(10)]
+        return self.buffers[shape]
+
+    def process(self, frame1, frame2, alpha=0.001, NumOfIter=8):
+        """
+        Compute optical flow using Horn-Schunck method
+
+        Parameters:
+        frame1: frame at t=0
+        frame2: frame at t=1
+        alpha: regularization constant
+        NumOfIter: number of iteration
+
+        Returns:
+        H, V: Horizontal and vertical components of optical flow
+        M: Magnitude of flow vectors
+        """
+        fx, fy, ft, down, H, V, hAvg, vAvg, der, tmp = self.getBuffers(frame1.shape[:2])
+
+        # Estimate derivatives
+        self.derivatives(frame1, frame2, fx, fy, ft, tmp)
+        cv2.multiply(fx, fx, down)
+        cv2.multiply(fy, fy, tmp)
+        cv2.add(down, tmp, down)
+        cv2.add(down, alpha**2, down)
+
+        # Initialize flow vectors
+        H.fill(0)
+        V.fill(0)
+
+        # Iterative refinement to reduce error
+        for i in range(NumOfIter):
+            # Average the flow vectors
+            cv2.filter2D(H, -1, self.kernelAvg, dst=hAvg)
+            cv2.filter2D(V, -1, self.kernelAvg, dst=vAvg)
+
+            # Common part of update step
+            cv2.multiply(fx, hAvg, der)
+            cv2.multiply(fy, vAvg, tmp)
+            cv2.add(der, tmp, der)
+            cv2.add(der, ft, der)
+            cv2.divide(der, down, der)
+
+            # Iterative step
+            cv2.multiply(fx, der, tmp)
+            cv2.subtract(hAvg, tmp, H)
+            cv2.multiply(fy, der, tmp)
+            cv2.subtract(vAvg, tmp, V)
+
+        # Calculate magnitude
+        M = cv2.magnitude(H, V)
+
+        return H.copy(), V.copy(), M
+
+    def derivatives(self, frame1, frame2, fx=None, fy=None, ft=None, tmp=None):
+        """Calculate spatial and temporal derivatives"""
+        frame1 = np.float32(frame1)
+        frame2 = np.float32(frame2)
+        fx, fy, ft, tmp = [np.empty(frame1.shape, np.float32) if buffer is None else buffer
+                           for buffer in (fx, fy, ft, tmp)]
+
+        # the derivatives are linear, so the filters of the two frames are one filter of their sum / difference
+        cv2.add(frame1, frame2, tmp)
+        cv2.filter2D(tmp, -1, self.kernelX, dst=fx, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        cv2.filter2D(tmp, -1, self.kernelY, dst=fy, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        cv2.subtract(frame1, frame2, tmp)
+        cv2.filter2D(tmp, -1, self.kernelT, dst=ft, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        return fx, fy, ft
+
+    def process_batch(self, frames1, frames2, alpha=0.001, NumOfIter=8):
+        """
+        Compute optical flow of many frame pairs at once
+
+        The frames are padded with their own borders and stacked into one tall image, so every
+        filter and update step is one operation over a group of pairs, with the same results as
+        processing them one by one.
+
+        Parameters:
+        frames1: frames at t=0
+        frames2: frames at t=1, one for every frame of frames1
+        alpha: regularization constant
+        NumOfIter: number of iteration
+
+        Returns:
+        H, V, M: (pairs, rows, cols) flow components and magnitudes of every pair
+        """
+        rows, cols = frames1[0].shape[:2]
+        H = np.empty((len(frames1), rows, cols), np.float32)
+        V = np.empty((len(frames1), rows, cols), np.float32)
+        M = np.empty((len(frames1), rows, cols), np.float32)
+
+        for start in range(0, len(frames1), MAX_BATCH_SIZE):
+            stop = min(start + MAX_BATCH_SIZE, len(frames1))
+            h, v, m = self.processStacked(frames1[start:stop], frames2[start:stop], alpha, NumOfIter)
+            H[start:stop] = h[:, 1:-1, 1:-1]
+            V[start:stop] = v[:, 1:-1, 1:-1]
+            M[start:stop] = m[:, 1:-1, 1:-1]
+
+        return H, V, M
+
+    def processStacked(self, frames1, frames2, alpha, NumOfIter):
+        """
+        Same steps as process on (pairs, rows + 2, cols + 2) stacks of frames padded by one pixel
+
+        Only the inside of every padded frame is meaningful, the padding is refreshed from it
+        before each filter, so a filter of the whole stack never mixes two frames.
+        """
+        pairs = len(frames1)
+        rows, cols = frames1[0].shape[:2]
+        shape = (pairs, rows + 2, cols + 2)
+        fx, fy, ft, down, H, V, hAvg, vAvg, der, tmp = [np.empty(shape, np.float32) for _ in range(10)]
+        tall = [buffer.reshape(pairs * (rows + 2), cols + 2) for buffer in (fx, fy, ft, down, H, V, hAvg, vAvg, der, tmp)]
+        fx2, fy2, ft2, down2, H2, V2, hAvg2, vAvg2, der2, tmp2 = tall
+
+        # Estimate derivatives, the 2x2 kernels only reach the next row and column
+        frame1, frame2 = hAvg, vAvg
+        frame1[:, 1:-1, 1:-1] = frames1
+        frame2[:, 1:-1, 1:-1] = frames2
+        self.padReflect(frame1)
+        self.padReflect(frame2)
+        cv2.add(hAvg2, vAvg2, tmp2)
+        cv2.filter2D(tmp2, -1, self.kernelX, dst=fx2, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        cv2.filter2D(tmp2, -1, self.kernelY, dst=fy2, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        cv2.subtract(hAvg2, vAvg2, tmp2)
+        cv2.filter2D(tmp2, -1, self.kernelT, dst=ft2, anchor=(0, 0), borderType=cv2.BORDER_REFLECT)
+        cv2.multiply(fx2, fx2, down2)
+        cv2.multiply(fy2, fy2, tmp2)
+        cv2.add(down2, tmp2, down2)
+        cv2.add(down2, alpha**2, down2)
+
+        # Initialize flow vectors
+        H.fill(0)
+        V.fill(0)
+
+        # Iterative refinement to reduce error
+        for i in range(NumOfIter):
+            # Average the flow vectors
+            self.padReflect101(H)
+            self.padReflect101(V)
+            cv2.filter2D(H2, -1, self.kernelAvg, dst=hAvg2)
+            cv2.filter2D(V2, -1, self.kernelAvg, dst=vAvg2)
+
+            # Common part of update step
+            cv2.multiply(fx2, hAvg2, der2)
+            cv2.multiply(fy2, vAvg2, tmp2)
+            cv2.add(der2, tmp2, der2)
+            cv2.add(der2, ft2, der2)
+            cv2.divide(der2, down2, der2)
+
+            # Iterative step
+            cv2.multiply(fx2, der2, tmp2)
+            cv2.subtract(hAvg2, tmp2, H2)
+            cv2.multiply(fy2, der2, tmp2)
+            cv2.subtract(vAvg2, tmp2, V2)
+
+        # Calculate magnitude
+        M = cv2.magnitude(H2, V2).reshape(shape)
+
+        return H, V, M
+
+    @staticmethod
+    def padReflect(stack):
+        """Padding of cv2.BORDER_REFLECT on the bottom and right of every padded frame"""
+        stack[:, -1, :] = stack[:, -2, :]
+        stack[:, :, -1] = stack[:, :, -2]
+
+    @staticmethod
+    def padReflect101(stack):
+        """Padding of cv2.BORDER_REFLECT_101 around every padded frame"""
+        stack[:, 0, :] = stack[:, 2, :]
+        stack[:, -1, :] = stack[:, -3, :]
+        stack[:, :, 0] = stack[:, :, 2]
+        stack[:, :, -1] = stack[:, :, -3]
+
 if __name__ == "__main__":
     # Example usage
     cap = cv2.VideoCapture("2.mkv")
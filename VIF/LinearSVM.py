@@ -0,0 +1,137 @@
+import hashlib
+import os
+import pickle
+import sys
+
+import numpy as np
+
+
+class LinearSVM:
+    """
+    Decision function of a linear sklearn SVC as plain numpy arrays
+
+    A linear SVC decides with the sign of x . weights + bias, so a whole batch of feature
+    vectors is one matrix-vector product, and loading the model doesn't import sklearn.
+    """
+
+    def __init__(self, weights, bias, classes):
+        """
+        Args:
+            weights: Weight of every feature
+            bias: Intercept of the decision function
+            classes: Class predicted for a negative and for a positive decision
+        """
+        self.weights = np.asarray(weights, np.float64)
+        self.bias = float(bias)
+        self.classes = np.asarray(classes)
+
+    @classmethod
+    def load(cls, path, source_digest=None):
+        """
+        Load a model file written by export
+
+        Args:
+            path: Path of the model file
+            source_digest: Digest of the pickle the model has to be exported from, None for any
+
+        Returns:
+            The linear model, or None if it was exported from another pickle
+        """
+        with np.load(path) as model:
+            if source_digest is not None and str(model.get("source_digest", "")) != source_digest:
+                return None
+            return cls(model["weights"], model["bias"], model["classes"])
+
+    @classmethod
+    def fromClassifier(cls, clf):
+        """
+        Get the decision function of a fitted binary sklearn SVC
+
+        Returns:
+            The linear model, or None if the classifier isn't a binary linear one
+        """
+        if getattr(clf, "kernel", None) != "linear" or len(clf.classes_) != 2:
+            return None
+        # the dual coefficients and intercept of a binary SVC are signed for classes_[1]
+        weights = np.asarray(clf.dual_coef_ @ clf.support_vectors_).ravel()
+        return cls(weights, clf.intercept_[0], clf.classes_)
+
+    def save(self, path, source_digest=""):
+        np.savez(path, weights=self.weights, bias=self.bias, classes=self.classes, source_digest=source_digest)
+
+    def decision_function(self, feature_vecs):
+        """Signed distance of every feature vector to the separating hyperplane"""
+        return np.asarray(feature_vecs, np.float64).reshape(-1, len(self.weights)) @ self.weights + self.bias
+
+    def predict(self, feature_vecs):
+        """Class of every feature vector, same as SVC.predict"""
+        return self.classes[(self.decision_function(feature_vecs) > 0).astype(int)]
+
+
+def linearModelPath(model_path):
+    """Path of the exported linear model of a pickled classifier"""
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def modelDigest(model_path):
+    """Digest of a pickled classifier, to tell whether an exported model comes from it"""
+    with open(model_path, 'rb') as model_file:
+        return hashlib.sha256(model_file.read()).hexdigest()
+
+
+def loadClassifier(model_path):
+    """
+    Load the classifier of a pickled sklearn model
+
+    The exported linear model is used when it was exported from the current pickle,
+    otherwise the pickle is loaded, which needs sklearn (the model isn't linear, or was
+    retrained and not exported again).
+
+    Args:
+        model_path: Path of the pickled classifier
+
+    Returns:
+        Classifier with a predict of a batch of feature vectors
+    """
+    linear_path = linearModelPath(model_path)
+    if os.path.exists(linear_path):
+        model = LinearSVM.load(linear_path, modelDigest(model_path))
+        if model is not None:
+            return model
+    return pickle.load(open(model_path, 'rb'))
+
+
+def export(model_path):
+    """
+    Export the decision function of a pickled linear SVC next to it
+
+    Returns:
+        Path of the exported model, or None if the classifier isn't linear
+    """
+    clf = pickle.load(open(model_path, 'rb'))
+    model = LinearSVM.fromClassifier(clf)
+    linear_path = linearModelPath(model_path)
+    if model is None:
+        # a model exported from an earlier classifier mustn't be used for this one
+        if os.path.exists(linear_path):
+            os.remove(linear_path)
+        return None
+
+    model.save(linear_path, modelDigest(model_path))
+
+    # the exported model has to decide like the classifier it comes from
+    support_vectors = np.asarray(clf.support_vectors_)
+    if not np.array_equal(model.predict(support_vectors), clf.predict(support_vectors)):
+        os.remove(linear_path)
+        raise ValueError("exported model of %s doesn't predict like the classifier" % model_path)
+    return linear_path
+
+
+if __name__ == "__main__":
+    # Example usage: python -m VIF.LinearSVM VIF/model-svm1.sav
+    for path in sys.argv[1:] or [os.path.join(os.path.dirname(os.path.realpath(__file__)), "model-svm1.sav")]:
+        exported = export(path)
+        if exported is None:
+            print("%s isn't a binary linear SVC, it stays on sklearn" % path)
+        else:
+            print("exported %s to %s" % (path, exported))
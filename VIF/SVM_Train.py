@@ -3,6 +3,7 @@ from sklearn.metrics import average_precision_score, precision_score, recall_sco
 from sklearn import metrics
 import pickle
 from sklearn.svm import SVC
+from LinearSVM import export  # run from VIF/, next to its data and model files
 from numpy import genfromtxt
 import numpy as np
 import matplotlib.pyplot as plt
@@ -75,5 +76,8 @@ roc_auc = metrics.auc(fpr, tpr)
 
 pickle.dump(clf, open('model-svm1.sav', 'wb'))
 
+# the crash node loads the exported decision function, so it has to follow the retrained model
+export('model-svm1.sav')
+
 
 
@@ -1,10 +1,16 @@
-import pickle
 import os
 import numpy as np
 import cv2
 import math
 
-from VIF.HornSchunck import HornSchunck
+from VIF.HornSchunck import HornSchunck, HornSchunckCV
+from VIF.LinearSVM import loadClassifier
+from System.Data.CONSTANTS import Work_VIF_OpenCV_Flow
+
+#bin edges of the flow histogram of every block
+HIST_BINS = np.arange(0, 1, 0.05)
+#upper edge of every bin, the last bin is closed
+HIST_UPPER_EDGES = np.append(HIST_BINS[1:-1], np.inf)
 
 
 class VIF:
@@ -12,16 +18,24 @@ class VIF:
     Visual Information Fidelity (VIF) crash detection implementation
     """
     
-    def __init__(self):
-        """Initialize VIF model and parameters"""
+    def __init__(self, opencv_flow=None):
+        """
+        Initialize VIF model and parameters
+
+        Args:
+            opencv_flow: Compute the optical flow with the float32 OpenCV Horn-Schunck instead of the scipy one,
+                Work_VIF_OpenCV_Flow by default
+        """
+        if opencv_flow is None:
+            opencv_flow = Work_VIF_OpenCV_Flow
         self.subSampling = 3
         self.rows = 100
         self.cols = 134
-        self.hs = HornSchunck()
+        self.hs = HornSchunckCV() if opencv_flow else HornSchunck()
         
-        # Load trained model
+        # Load trained model, as its exported linear decision function when there is one
         model_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "model-svm1.sav")
-        self.clf = pickle.load(open(model_path, 'rb'))
+        self.clf = loadClassifier(model_path)
         
         # Counters for tracking
         self.no_crash = 0
@@ -42,14 +56,28 @@ class VIF:
         B_height = int(math.floor((height - 11) / N))
         B_width = int(math.floor((width - 11) / M))
 
-        frame_hist = []
-
-        for y in np.arange(6, height - B_height - 5, B_height):
-            for x in np.arange(6, width - B_width - 5, B_width):
-                block_hist = self.createHist(flow[y:y + B_height - 1, x:x + B_width - 1])
-                frame_hist.append(block_hist)
-
-        return np.array(frame_hist).flatten()
+        # All the blocks at once, as (blocks, pixels)
+        ys = np.arange(6, height - B_height - 5, B_height)
+        xs = np.arange(6, width - B_width - 5, B_width)
+        rows = ys[:, None] + np.arange(B_height - 1)
+        cols = xs[:, None] + np.arange(B_width - 1)
+        blocks = flow[rows[:, None, :, None], cols[None, :, None, :]].reshape(len(ys) * len(xs), -1)
+
+        # Bin of every value with the bounds of np.histogram: the bins are 0.05 wide, so the
+        # scaled value is the bin up to rounding, which a comparison with the edges corrects
+        no_of_bins = len(HIST_BINS) - 1
+        bins = np.clip(np.floor(blocks * 20), 0, no_of_bins - 1).astype(np.intp)
+        bins -= blocks < HIST_BINS[bins]
+        bins += blocks >= HIST_UPPER_EDGES[bins]
+        counted = (blocks >= HIST_BINS[0]) & (blocks <= HIST_BINS[-1])
+
+        # One count over all the blocks, every block with its own range of bins
+        block_offsets = np.arange(len(blocks))[:, None] * no_of_bins
+        counts = np.bincount((bins + block_offsets)[counted], minlength=len(blocks) * no_of_bins)
+        counts = counts.reshape(len(blocks), no_of_bins)
+
+        # Normalize the histogram of every block
+        return (counts / counts.sum(axis=1, keepdims=True)).flatten()
 
     def createHist(self, mini_flow):
         """
@@ -61,17 +89,78 @@ class VIF:
         Returns:
             Normalized histogram
         """
-        H = np.histogram(mini_flow, np.arange(0, 1, 0.05))
+        H = np.histogram(mini_flow, HIST_BINS)
         H = H[0]/float(np.sum(H[0]))
         return H
 
-    def process(self, frames):
+    def process(self, frames, flow_cache=None):
         """
         Process frames to extract VIF features
         
         Args:
             frames: List of video frames
+            flow_cache: Dict keeping the flow magnitude of every frame pair of these frames,
+                shared by the calls on the same frames
             
+        Returns:
+            Feature vector for crash detection
+        """
+        return self.process_batch([frames], [flow_cache])[0]
+
+    def process_batch(self, frame_sets, flow_caches=None):
+        """
+        Process the frames of many vehicles at once to extract their VIF features
+
+        The optical flow of all the frame pairs that aren't cached yet is computed in one batch.
+
+        Args:
+            frame_sets: List of the video frames of every vehicle
+            flow_caches: Flow cache of every frame set (see process), None for no cache
+
+        Returns:
+            List of the feature vectors of the frame sets
+        """
+        shape = (self.cols, self.rows)
+        if flow_caches is None:
+            flow_caches = [None] * len(frame_sets)
+        flow_caches = [{} if flow_cache is None else flow_cache for flow_cache in flow_caches]
+
+        # Frame pairs whose flow isn't known yet, every frame resized once
+        frames1, frames2, missing = [], [], {}
+        for frames, flow_cache in zip(frame_sets, flow_caches):
+            resized_frames = {}
+            for triple in self.frameTriples(len(frames)):
+                for pair in (triple[:2], triple[1:]):
+                    if pair in flow_cache or (id(flow_cache), pair) in missing:
+                        continue
+                    for frame_no in pair:
+                        if frame_no not in resized_frames:
+                            resized_frames[frame_no] = cv2.resize(frames[frame_no], shape)
+                    missing[(id(flow_cache), pair)] = (flow_cache, pair)
+                    frames1.append(resized_frames[pair[0]])
+                    frames2.append(resized_frames[pair[1]])
+
+        # Calculate optical flow between all the consecutive frames
+        if len(missing) > 0:
+            _, _, magnitudes = self.hs.process_batch(frames1, frames2)
+            for (flow_cache, pair), magnitude in zip(missing.values(), magnitudes):
+                flow_cache[pair] = magnitude
+
+        return [self.features(flow_cache, len(frames)) for frames, flow_cache in zip(frame_sets, flow_caches)]
+
+    def frameTriples(self, no_of_frames):
+        """(previous, current, next) frame numbers of the triples compared with subsampling"""
+        return [(i + self.subSampling, i + self.subSampling * 2, i + self.subSampling * 3)
+                for i in range(0, no_of_frames - self.subSampling - 5, self.subSampling * 2)]
+
+    def features(self, flow_cache, no_of_frames):
+        """
+        Feature vector of a frame set from the flow of its frame pairs
+
+        Args:
+            flow_cache: Flow magnitude of every frame pair of the set
+            no_of_frames: Number of frames of the set
+
         Returns:
             Feature vector for crash detection
         """
@@ -80,25 +169,13 @@ class VIF:
         index = 0
         N = 4  # Number of blocks in height
         M = 4  # Number of blocks in width
-        shape = (self.cols, self.rows)
 
-        # Process frames with subsampling
-        for i in range(0, len(frames) - self.subSampling - 5, self.subSampling * 2):
+        for prevFrame, currFrame, nextFrame in self.frameTriples(no_of_frames):
             index += 1
-            
-            # Get three frames with spacing
-            prevFrame = frames[i + self.subSampling]
-            currFrame = frames[i + self.subSampling * 2]
-            nextFrame = frames[i + self.subSampling * 3]
-
-            # Resize frames to standard size
-            prevFrame = cv2.resize(prevFrame, shape)
-            currFrame = cv2.resize(currFrame, shape)
-            nextFrame = cv2.resize(nextFrame, shape)
 
-            # Calculate optical flow between consecutive frames
-            u1, v1, m1 = self.hs.process(prevFrame, currFrame)
-            u2, v2, m2 = self.hs.process(currFrame, nextFrame)
+            # Flow between consecutive frames
+            m1 = flow_cache[(prevFrame, currFrame)]
+            m2 = flow_cache[(currFrame, nextFrame)]
 
             # Detect significant changes in flow
             delta = abs(m1 - m2)
@@ -112,4 +189,4 @@ class VIF:
         # Create feature vector from flow histograms
         feature_vec = self.createBlockHist(flow, N, M)
 
-        return feature_vec
\ No newline at end of file
+        return feature_vec
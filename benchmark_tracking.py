@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the MOSSE tracker
+"""
+
+import glob
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from Mosse_Tracker.Mosse import MOSSE, windowAndTarget
+from Mosse_Tracker.TrackerManager import TrackerType
+from System.Functions.Crashing import Crashing, CRASH_CHECK_FRAMES
+from System.Functions.Tracking import Tracking
+from boxes.yoloFiles import loadFile
+
+
+def legacyUpdateFilter(tracker):
+    """The filter update as it was done before it was computed in place"""
+    Num, Den = tracker.H1, tracker.H2
+    h_filter = (Num[..., 0] + 1j * Num[..., 1]) / (Den[..., 0] + 1j * Den[..., 1])
+    tracker.H = np.dstack([np.real(h_filter), np.imag(h_filter)]).copy()
+    tracker.H[..., 1] *= -1
+
+
+def measureAllocations(update, tracker, repeats):
+    """Time of one filter update and the most memory it allocates on top of the tracker's buffers"""
+    update(tracker)  # warm up
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        update(tracker)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / repeats, peak - baseline
+
+
+def benchmarkFilterUpdate(size=64, repeats=2000):
+    frame = np.random.randint(0, 255, (360, 480), np.uint8)
+    tracker = MOSSE(frame, (100, 100, 100 + size, 100 + size))
+
+    print("filter update of a %dx%d patch" % tracker.size)
+    for name, update in [("legacy", legacyUpdateFilter), ("in place", MOSSE.updateFilter)]:
+        # every update starts from the tracker's own buffers
+        tracker.H = np.zeros_like(tracker.G)
+        seconds, allocated = measureAllocations(update, tracker, repeats)
+        print("  %-8s %8.1f us/update  %8d bytes allocated per update" % (name, seconds * 1e6, allocated))
+
+
+
+def benchmarkWindowAndTarget(size=64, repeats=2000):
+    width, height = map(cv2.getOptimalDFTSize, [size, size])
+    print("window and target of a %dx%d patch" % (width, height))
+    for name, cached in [("built", False), ("cached", True)]:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            if not cached:
+                windowAndTarget.cache_clear()
+            windowAndTarget(width, height)
+        print("  %-8s %8.1f us/tracker" % (name, (time.perf_counter() - start) / repeats * 1e6))
+
+
+def loadReplay(video="Mosse_Tracker/Easy.mp4", no_of_frames=30, frame_width=480, frame_height=360):
+    """Frames of the sample video and the vehicles of the first batch of every boxes/*.txt file"""
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < no_of_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (frame_width, frame_height), interpolation=cv2.INTER_AREA))
+
+    boxes = []
+    for file_name in sorted(glob.glob("boxes/1*.txt")):
+        for box in loadFile(file_name)[0]:
+            _, xmin, xmax, ymin, ymax, _ = box
+            if 0 <= xmin and xmax < frame_width and 0 <= ymin and ymax < frame_height \
+                    and xmax - xmin >= 8 and ymax - ymin >= 8:
+                boxes.append(box)
+    return frames, boxes
+
+
+# Frozen copies of Crashing.checkDistance and of the pair loop of Crashing.crash from before the
+# checks were array operations, the pairs they flag are recorded instead of sent to the model
+def baselineCheckDistance(tracker_A, tracker_B, frame_no, distance_threshold):
+    # Skip if neither vehicle is moving fast enough
+    if not tracker_A.isAboveSpeedLimit(frame_no - 10, frame_no) and not tracker_B.isAboveSpeedLimit(frame_no - 10, frame_no):
+        return False
+
+    # Get predicted positions
+    xa, ya = tracker_A.estimationFutureCenter[frame_no]
+    xb, yb = tracker_B.estimationFutureCenter[frame_no]
+
+    # Calculate distance between predicted positions
+    r = pow(pow(xa - xb, 2) + pow(ya - yb, 2), 0.5)
+
+    # Direct collision if distance is zero
+    if r == 0:
+        return True
+    # Not a collision if distance is greater than threshold
+    elif r > distance_threshold:
+        return False
+
+    # Get actual positions
+    if tracker_A.tracker_type == TrackerType.MOSSE:
+        xa_actual, ya_actual = tracker_A.tracker.centers[frame_no]
+        xb_actual, yb_actual = tracker_B.tracker.centers[frame_no]
+    else:
+        xa_actual, ya_actual = tracker_A.get_position(tracker_A.history[frame_no])
+        xb_actual, yb_actual = tracker_B.get_position(tracker_B.history[frame_no])
+
+    # Calculate difference between actual and predicted positions
+    difference_trackerA_actual_to_estimate = pow(pow(xa_actual - xa, 2) + pow(ya_actual - ya, 2), 0.5)
+    difference_trackerB_actual_to_estimate = pow(pow(xb_actual - xb, 2) + pow(yb_actual - yb, 2), 0.5)
+    max_difference = max(difference_trackerA_actual_to_estimate, difference_trackerB_actual_to_estimate)
+
+    # If the difference is significant compared to the distance, consider it a collision
+    return max_difference / r > 0.5
+
+
+def baselineCollidingPairs(trackers):
+    pairs = []
+
+    # Check all tracker pairs for potential collisions
+    for i in range(len(trackers)):
+        for j in range(i + 1, len(trackers)):
+            if i == j:
+                continue
+
+            tracker_A = trackers[i]
+            tracker_B = trackers[j]
+
+            # Calculate distance threshold based on vehicle sizes
+            asize = pow(pow(tracker_A.vehicle_height, 2) + pow(tracker_A.vehicle_width, 2), 0.5) * .25
+            bsize = pow(pow(tracker_B.vehicle_height, 2) + pow(tracker_B.vehicle_width, 2), 0.5) * .25
+            distance_threshold = asize + bsize
+
+            # Check for collisions at different time points
+            if (baselineCheckDistance(tracker_A, tracker_B, 16, distance_threshold) or
+                baselineCheckDistance(tracker_A, tracker_B, 19, distance_threshold) or
+                baselineCheckDistance(tracker_A, tracker_B, 22, distance_threshold) or
+                baselineCheckDistance(tracker_A, tracker_B, 25, distance_threshold) or
+                baselineCheckDistance(tracker_A, tracker_B, 28, distance_threshold)):
+                pairs.append((i, j))
+    return pairs
+
+
+def checkCrashPairs():
+    """Colliding pairs and speed gates of the replay's tracks, checked against the baseline pairwise checks"""
+    np.random.seed(0)  # the filters are trained on random rotations of the first patch
+    frames, boxes = loadReplay()
+    frame_height, frame_width = frames[0].shape[:2]
+    tracking = Tracking()
+    tracked = tracking.track(frames, boxes, frame_width, frame_height)
+    trackers = tracking.summaries(tracked)
+    sizes = np.array([pow(pow(tracker.vehicle_height, 2) + pow(tracker.vehicle_width, 2), 0.5) * .25
+                      for tracker in trackers])
+    crashing = Crashing(None)
+
+    # the baseline checks ran on the whole trackers, not on their summaries
+    start = time.perf_counter()
+    baseline_fast = [[tracker.isAboveSpeedLimit(frame_no - 10, frame_no) for frame_no in CRASH_CHECK_FRAMES]
+                     for tracker in tracked]
+    baseline_pairs = baselineCollidingPairs(tracked)
+    baseline_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = crashing.trackArrays(trackers)[2]
+    pairs = crashing.collidingPairs(trackers, sizes)
+    array_time = time.perf_counter() - start
+
+    print("collision checks of %d tracks, %d fast at some checked frame" % (len(trackers), np.any(fast, axis=1).sum()))
+    print("  pairwise %7.1f ms  arrays %7.1f ms" % (baseline_time * 1e3, array_time * 1e3))
+    print("  %d colliding pairs, %s, %s" % (len(pairs),
+                                            "same pairs" if pairs == baseline_pairs else "PAIRS DIFFER",
+                                            "same speed gates" if fast.tolist() == baseline_fast else "SPEED GATES DIFFER"))
+
+
+if __name__ == "__main__":
+    benchmarkFilterUpdate(*map(int, sys.argv[1:]))
+    benchmarkWindowAndTarget(*map(int, sys.argv[1:2]))
+    checkCrashPairs()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks and regression check of the ViF descriptor
+"""
+
+import math
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from VIF.HornSchunck import HornSchunck, HornSchunckCV
+from VIF.vif import VIF, HIST_BINS
+
+
+def loadGrayFrames(video="Mosse_Tracker/Easy.mp4", no_of_frames=30):
+    """Gray frames of the sample video"""
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < no_of_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    return frames
+
+
+def createVIF(hs):
+    """A ViF descriptor with the given flow backend, without loading the classifier"""
+    vif = VIF.__new__(VIF)
+    vif.subSampling = 3
+    vif.rows = 100
+    vif.cols = 134
+    vif.hs = hs
+    return vif
+
+
+def sampleCrops(frames, shape, size=(80, 120), step=(80, 40)):
+    """Resized crops of the frames over a grid of boxes, as the crash node feeds them to ViF"""
+    height, width = frames[0].shape[:2]
+    for y in range(0, height - size[1] + 1, step[1]):
+        for x in range(0, width - size[0] + 1, step[0]):
+            yield [cv2.resize(frame[y:y + size[1], x:x + size[0]], shape) for frame in frames]
+
+
+def benchmarkFlowPair(repeats=200):
+    frames = loadGrayFrames()
+    vif = createVIF(HornSchunck())
+    frame1, frame2 = [cv2.resize(frame, (vif.cols, vif.rows)) for frame in frames[3:5]]
+
+    print("horn-schunck flow of a %dx%d pair" % (vif.cols, vif.rows))
+    flows = []
+    for hs in [HornSchunck(), HornSchunckCV()]:
+        hs.process(frame1, frame2)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            flow = hs.process(frame1, frame2)
+        flows.append(flow[2])
+        print("  %-14s %8.1f us/pair" % (type(hs).__name__, (time.perf_counter() - start) / repeats * 1e6))
+    print("  max magnitude difference %.2e" % np.abs(flows[0] - flows[1]).max())
+
+
+def benchmarkBatch():
+    frames = loadGrayFrames()
+    vif = createVIF(HornSchunckCV())
+    frame_sets = list(sampleCrops(frames, (vif.cols, vif.rows)))
+
+    print("feature vectors of %d crops" % len(frame_sets))
+    start = time.perf_counter()
+    features = [vif.process(crops) for crops in frame_sets]
+    one_by_one = time.perf_counter() - start
+    start = time.perf_counter()
+    batch_features = vif.process_batch(frame_sets)
+    batch = time.perf_counter() - start
+    difference = max(np.abs(a - b).max() for a, b in zip(features, batch_features))
+    print("  one by one %8.1f ms  batch %8.1f ms  max difference %.2e" % (one_by_one * 1e3, batch * 1e3, difference))
+
+
+def checkFeatures(tolerance=1e-6):
+    """Feature vectors of both flow backends on crops of the sample video, they must match within tolerance"""
+    frames = loadGrayFrames()
+    vifs = [createVIF(HornSchunck()), createVIF(HornSchunckCV())]
+
+    differences = []
+    for crops in sampleCrops(frames, (vifs[0].cols, vifs[0].rows)):
+        features = [vif.process(crops) for vif in vifs]
+        differences.append(np.abs(features[0] - features[1]).max())
+
+    worst = max(differences)
+    print("feature vectors of %d crops, max difference %.2e: %s"
+          % (len(differences), worst, "match" if worst <= tolerance else "FEATURES DIFFER"))
+    return worst <= tolerance
+
+
+def loopBlockHist(vif, flow, N, M):
+    """The block histograms as they were computed before, one np.histogram per block"""
+    height, width = flow.shape
+    B_height = int(math.floor((height - 11) / N))
+    B_width = int(math.floor((width - 11) / M))
+
+    frame_hist = []
+    for y in np.arange(6, height - B_height - 5, B_height):
+        for x in np.arange(6, width - B_width - 5, B_width):
+            frame_hist.append(vif.createHist(flow[y:y + B_height - 1, x:x + B_width - 1]))
+    return np.array(frame_hist).flatten()
+
+
+def checkBlockHist(repeats=200):
+    """Block histograms of accumulated flows and of values on and around the bin edges, they must be identical"""
+    vif = createVIF(HornSchunckCV())
+    random = np.random.RandomState(0)
+    shape = (vif.rows, vif.cols)
+    flows = [random.randint(0, 5, shape) / 4.0, random.randint(0, 21, shape) / 20.0, random.rand(*shape),
+             random.rand(*shape) * 1.2 - 0.1, random.choice(HIST_BINS, shape), np.zeros(shape)]
+
+    identical = all(np.array_equal(loopBlockHist(vif, flow, 4, 4), vif.createBlockHist(flow, 4, 4))
+                    for flow in flows)
+
+    print("block histograms of a %dx%d flow" % (vif.cols, vif.rows))
+    for name, create in [("loop", lambda flow: loopBlockHist(vif, flow, 4, 4)),
+                         ("vectorized", lambda flow: vif.createBlockHist(flow, 4, 4))]:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            create(flows[0])
+        print("  %-10s %8.1f us/flow" % (name, (time.perf_counter() - start) / repeats * 1e6))
+    print("  %s" % ("identical" if identical else "HISTOGRAMS DIFFER"))
+    return identical
+
+
+if __name__ == "__main__":
+    benchmarkFlowPair(*map(int, sys.argv[1:2]))
+    benchmarkBatch()
+    if not checkBlockHist() or not checkFeatures():
+        sys.exit(1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test script for the sliding window of frame batches kept by every node
+Batches of a camera overlap by 15 frames and only the new ones are sent
+"""
+
+import numpy as np
+
+from System.Data.CONSTANTS import *
+from System.Data.FrameWindow import FrameWindow
+
+
+def cameraBatch(starting_frame_id, overlap):
+    """Frames a camera sends with the batch starting at starting_frame_id, every frame is filled with its id"""
+    return [np.full((4, 4, 3), frame_id % 256, np.uint8)
+            for frame_id in range(starting_frame_id + overlap, starting_frame_id + BATCH_FRAMES_NO)]
+
+
+def frameIds(frames):
+    return [int(frame[0, 0, 0]) for frame in frames]
+
+
+def test_consecutive_batches():
+    window = FrameWindow()
+    window.extend(1, 1, cameraBatch(1, 0), 0)
+    frames, overlap = window.extend(1, 16, cameraBatch(16, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert overlap == BATCH_OVERLAP_NO
+    assert frameIds(frames) == list(range(16, 16 + BATCH_FRAMES_NO))
+
+
+def test_dropped_batch():
+    window = FrameWindow()
+    window.extend(1, 1, cameraBatch(1, 0), 0)
+    window.extend(1, 16, cameraBatch(16, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    # the batch at 31 is lost, the one after it is dropped too: its detections are for frames the node doesn't have
+    frames, overlap = window.extend(1, 46, cameraBatch(46, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert frames is None
+
+    # the next batch is full, and goes on whole since the next nodes missed the dropped one too
+    frames, overlap = window.extend(1, 61, cameraBatch(61, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert overlap == 0
+    assert frameIds(frames) == list(range(61, 61 + BATCH_FRAMES_NO))
+
+    frames, overlap = window.extend(1, 76, cameraBatch(76, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert overlap == BATCH_OVERLAP_NO
+    assert frameIds(frames) == list(range(76, 76 + BATCH_FRAMES_NO))
+
+
+def test_restarted_node():
+    # a node that starts while the camera is already sending overlapping batches
+    window = FrameWindow()
+    frames, overlap = window.extend(1, 46, cameraBatch(46, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert frames is None
+    frames, overlap = window.extend(1, 61, cameraBatch(61, BATCH_OVERLAP_NO), BATCH_OVERLAP_NO)
+    assert overlap == 0
+    assert frameIds(frames) == list(range(61, 61 + BATCH_FRAMES_NO))
+
+
+def test_boxes_after_dropped_batch():
+    # the boxes of a batch must stay with the frames they were detected on, through two tracking nodes
+    import pickle
+    from System.Controller.JsonDecoder import JsonDecoder
+
+    def trackMessage(starting_frame_id, frames, overlap):
+        return [pickle.dumps({FUNCTION: TRACK, CAMERA_ID: 1, STARTING_FRAME_ID: starting_frame_id,
+                              FRAME_WIDTH: 4, FRAME_HEIGHT: 4, BOXES: [starting_frame_id], CITY: "", DISTRICT: "",
+                              START_DETECT_TIME: 0, END_DETECT_TIME: 0, FRAMES: frames, OVERLAP: overlap})]
+
+    nodes = [JsonDecoder(), JsonDecoder()]
+    tracked = [[], []]
+    for node, batches, next_node in zip(nodes, tracked, [nodes[1], None]):
+        def track(camera_id, starting_frame_id, frames, frame_width, frame_height, boxes, *args,
+                  batches=batches, next_node=next_node):
+            overlap = args[-1]
+            batches.append((starting_frame_id, boxes, frameIds(frames), overlap))
+            if next_node is not None:
+                next_node.decode(trackMessage(starting_frame_id, frames[overlap:], overlap))
+        node.track = track
+
+    for batch_id in (1, 16, 46, 61, 76):
+        overlap = 0 if batch_id == 1 else BATCH_OVERLAP_NO
+        nodes[0].decode(trackMessage(batch_id, cameraBatch(batch_id, overlap), overlap))
+
+    for batches in tracked:
+        assert [batch[0] for batch in batches] == [1, 16, 61, 76]
+        for starting_frame_id, boxes, frame_ids, overlap in batches:
+            assert boxes == [starting_frame_id]
+            assert frame_ids == list(range(starting_frame_id, starting_frame_id + BATCH_FRAMES_NO))
+
+
+if __name__ == "__main__":
+    test_consecutive_batches()
+    test_dropped_batch()
+    test_restarted_node()
+    test_boxes_after_dropped_batch()
+    print("FrameWindow: all checks passed")